@@ -0,0 +1,123 @@
+"""
+Benchmark of Opus-MT batching.
+
+Compares the previous fixed batching, which sorted sentences by characters and translated
+them in slices of `--batch_size`, with the token-budget batching of
+`OpusMTWrapper.translate_sentences` on synthetic subtitle text: mostly short lines with
+a few long sentences mixed in. Both translate every sentence, the deduplication of repeated
+sentences in `translate_sentences` is left out.
+
+Downloads the Opus-MT model for the language pair on the first run.
+
+Usage:
+    python benchmarks/opusmt_batching.py --sentences 2000 --source en --target de
+    python benchmarks/opusmt_batching.py --mode opusmt-ct2 --max_tokens 8192
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from faster_auto_subtitle.main import load_translator
+
+SHORT_LINES = ["Yeah.", "What?", "No!", "Okay.", "Hey.", "Thank you.", "Come on!", "I know.",
+               "Where is he?", "Let's go.", "Are you sure?", "Not now.", "Wait for me!"]
+MEDIUM_LINES = ["I don't think that's a good idea right now.",
+                "We have to leave before the sun goes down.",
+                "Did you really think I wouldn't find out about this?",
+                "She said she would call as soon as she lands.",
+                "Nobody has seen him since the night of the party."]
+LONG_LINES = ["If we don't get the engine fixed by tomorrow morning, the whole crew is going to be "
+              "stuck on this island for another week, and I promised my daughter I'd be home.",
+              "You keep telling me that everything is under control, but every time I turn around "
+              "something else is on fire and you're nowhere to be found, so forgive me if I'm worried."]
+
+
+def subtitle_sentences(count: int) -> list[str]:
+    rng = random.Random(0)
+    sentences = []
+    for _ in range(count):
+        pick = rng.random()
+        if pick < 0.55:
+            sentences.append(rng.choice(SHORT_LINES))
+        elif pick < 0.95:
+            sentences.append(rng.choice(MEDIUM_LINES))
+        else:
+            sentences.append(rng.choice(LONG_LINES))
+    return sentences
+
+
+def translate_fixed(wrapper, sentences: list[str], source: str, target: str,
+                    batch_size: int) -> list[str]:
+    length_sorted_idx = np.argsort([-len(sen) for sen in sentences])
+    sentences_sorted = [sentences[idx] for idx in length_sorted_idx]
+    output = []
+    for start_idx in range(0, len(sentences_sorted), batch_size):
+        output.extend(wrapper.translator.translate_sentences(
+            sentences_sorted[start_idx:start_idx + batch_size], source_lang=source,
+            target_lang=target, beam_size=5, device=wrapper.device))
+    return [output[idx] for idx in np.argsort(length_sorted_idx)]
+
+
+def translate_budget(wrapper, sentences: list[str], source: str, target: str,
+                     batch_size: int) -> list[str]:
+    # translate_sentences also translates repeated sentences only once, which would be
+    # measured instead of the batching
+    return wrapper._translate_batched(sentences, target, source,  # pylint: disable=protected-access
+                                      show_progress_bar=False, beam_size=5, batch_size=batch_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--mode", default="opusmt", choices=["opusmt", "opusmt-ct2"],
+                        help="translator backend")
+    parser.add_argument("--device", default="auto", help="device to translate on")
+    parser.add_argument("--source", default="en", help="source language")
+    parser.add_argument("--target", default="de", help="target language")
+    parser.add_argument("--sentences", type=int, default=2000,
+                        help="number of sentences to translate")
+    parser.add_argument("--batch_size", type=int, default=16,
+                        help="batch size of the fixed batching")
+    parser.add_argument("--max_batch_size", type=int, default=64,
+                        help="maximum number of sentences in a token-budget batch")
+    parser.add_argument("--max_tokens", type=int, default=None,
+                        help="token budget per batch, defaults to the wrapper's default")
+    args = parser.parse_args()
+
+    wrapper = load_translator(args.mode, "google", {}, args.device)
+    if args.max_tokens is not None:
+        wrapper.max_tokens = args.max_tokens
+    if not wrapper.translator.prepare_translation(args.source, args.target):
+        print(f"FAIL: no translation from {args.source} to {args.target}")
+        sys.exit(1)
+
+    sentences = subtitle_sentences(args.sentences)
+    # Warm up: loads the model and the tokenizer
+    translate_budget(wrapper, sentences[:32], args.source, args.target, args.max_batch_size)
+
+    runs = {"fixed": (translate_fixed, args.batch_size),
+            "token budget": (translate_budget, args.max_batch_size)}
+    outputs = {}
+    baseline = None
+    for name, (translate, batch_size) in runs.items():
+        start = time.perf_counter()
+        outputs[name] = translate(wrapper, sentences, args.source, args.target, batch_size)
+        duration = time.perf_counter() - start
+        speed = len(sentences) / duration
+        baseline = baseline or speed
+        print(f"{name:>14}: {speed:8.1f} sentences/s  ({speed / baseline:.2f}x)")
+
+    differences = sum(fixed != budget for fixed, budget in zip(*outputs.values()))
+    # Padding can change beam search slightly, so differences are reported but not fatal
+    print(f"{differences} of {len(sentences)} translations differ between the two batchings")
+
+
+if __name__ == '__main__':
+    main()
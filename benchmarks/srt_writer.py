@@ -0,0 +1,99 @@
+"""
+Microbenchmark of the SRT writer.
+
+Compares the previous writer, which printed every cue with flush=True, with the current
+buffered `write_srt` and the atomic `save_srt` on a synthetic transcript, and checks
+that all of them produce the same file.
+
+Usage:
+    python benchmarks/srt_writer.py --segments 100000
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+from typing import Iterator, TextIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from faster_whisper.transcribe import Segment
+from faster_auto_subtitle.utils.convert import format_timestamp
+from faster_auto_subtitle.utils.files import save_srt, write_srt
+
+
+def write_srt_unbuffered(transcript: Iterator[Segment], file: TextIO) -> None:
+    for i, segment in enumerate(transcript, start=1):
+        print(
+            f"{i}\n"
+            f"{format_timestamp(segment.start, always_include_hours=True)} --> "
+            f"{format_timestamp(segment.end, always_include_hours=True)}\n"
+            f"{segment.text.strip().replace('-->', '->')}\n",
+            file=file,
+            flush=True,
+        )
+
+
+def make_segments(count: int) -> list[Segment]:
+    segments = []
+    start = 0.0
+    for index in range(count):
+        # Every fifth segment is followed by a pause, the rest are back to back
+        end = round(start + 1.5 + (index % 7) * 0.37, 2)
+        segments.append(Segment(id=index + 1, seek=0, start=start, end=end,
+                                text=f" Segment number {index} says something --> here.",
+                                tokens=[], avg_logprob=0.0, compression_ratio=1.0,
+                                no_speech_prob=0.0, words=None, temperature=0.0))
+        start = round(end + (0.8 if index % 5 == 0 else 0.0), 2)
+    return segments
+
+
+def time_writer(writer, segments: list[Segment], path: str, repeat: int) -> float:
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        writer(segments, path)
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--segments", type=int, default=100_000,
+                        help="number of segments in the synthetic transcript")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="number of runs per writer, the median is used")
+    args = parser.parse_args()
+
+    segments = make_segments(args.segments)
+
+    def unbuffered(transcript, path):
+        with open(path, "w", encoding="utf-8") as srt:
+            write_srt_unbuffered(transcript, file=srt)
+
+    def buffered(transcript, path):
+        with open(path, "w", encoding="utf-8") as srt:
+            write_srt(transcript, file=srt)
+
+    writers = {"print(flush=True)": unbuffered, "write_srt": buffered, "save_srt": save_srt}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        outputs = {}
+        baseline = None
+        for name, writer in writers.items():
+            path = os.path.join(tmp_dir, f"{len(outputs)}.srt")
+            duration = time_writer(writer, segments, path, args.repeat)
+            baseline = baseline or duration
+            print(f"{name:>18}: {duration * 1000:8.1f} ms  ({baseline / duration:.1f}x)")
+            with open(path, "r", encoding="utf-8") as srt:
+                outputs[name] = srt.read()
+
+    if len(set(outputs.values())) != 1:
+        print("FAIL: writers produced different output")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
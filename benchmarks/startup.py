@@ -0,0 +1,129 @@
+"""
+Cold-start benchmark for the command line tool.
+
+Measures the import time of the entry point modules with `python -X importtime`
+and the wall time of `faster_auto_subtitle --help`, and fails if
+- a heavy module (faster_whisper, torch, transformers, ...) is imported at startup, or
+- a measurement exceeds the saved baseline by more than the allowed tolerance, or
+- no baseline was saved on this machine yet, so the comparison can't run.
+
+Usage:
+    python benchmarks/startup.py                  # compare with benchmarks/startup_baseline.json
+    python benchmarks/startup.py --save_baseline  # record the baseline on this machine
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+from typing import Optional
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(ROOT_DIR, "benchmarks", "startup_baseline.json")
+
+TRANSLATION_MODULES = ["torch", "transformers", "nltk"]
+# Modules that must not be imported by each entry point
+FORBIDDEN_MODULES = {
+    "faster_auto_subtitle.cli": ["faster_whisper", "ctranslate2", "numpy", "huggingface_hub"]
+                                + TRANSLATION_MODULES,
+    "faster_auto_subtitle.translation.opusmt": TRANSLATION_MODULES,
+}
+
+
+def run_python(*args: str) -> subprocess.CompletedProcess:
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT_DIR,
+                                                                     os.environ.get("PYTHONPATH")])))
+    return subprocess.run([sys.executable, *args], cwd=ROOT_DIR, env=env, capture_output=True,
+                          text=True, check=True)
+
+
+def import_times(module: Optional[str]) -> dict[str, int]:
+    """
+    Returns the cumulative import time in microseconds of every module loaded by `module`,
+    including the modules loaded by the interpreter at startup.
+    """
+    result = run_python("-X", "importtime", "-c", f"import {module}" if module else "pass")
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def measure_import(module: str, repeat: int) -> tuple[float, dict[str, int]]:
+    runs = [import_times(module) for _ in range(repeat)]
+    total_ms = statistics.median(run[module] for run in runs) / 1000
+    startup_modules = import_times(None)
+    return total_ms, {name: value for name, value in runs[-1].items()
+                      if name not in startup_modules}
+
+
+def measure_help(repeat: int) -> float:
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run_python("-m", "faster_auto_subtitle.cli", "--help")
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="number of runs per measurement, the median is used")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed slowdown relative to the baseline")
+    parser.add_argument("--top", type=int, default=10,
+                        help="number of slowest modules to show per entry point")
+    parser.add_argument("--save_baseline", action="store_true",
+                        help=f"store the results in {BASELINE_PATH}")
+    args = parser.parse_args()
+
+    # Warm up the bytecode cache
+    run_python("-c", "import faster_auto_subtitle.cli, faster_auto_subtitle.translation.opusmt")
+
+    failures = []
+    results = {}
+    for module, forbidden in FORBIDDEN_MODULES.items():
+        total_ms, times = measure_import(module, args.repeat)
+        results[f"import {module}"] = total_ms
+        print(f"import {module}: {total_ms:.1f} ms")
+        slowest = sorted(((name, value) for name, value in times.items() if name != module),
+                         key=lambda item: item[1], reverse=True)[:args.top]
+        for name, value in slowest:
+            print(f"    {value / 1000:8.1f} ms  {name}")
+
+        imported = sorted(name for name in forbidden
+                          if any(loaded == name or loaded.startswith(f"{name}.") for loaded in times))
+        if imported:
+            failures.append(f"import {module} loads {', '.join(imported)}")
+
+    results["--help"] = measure_help(args.repeat)
+    print(f"faster_auto_subtitle --help: {results['--help']:.1f} ms")
+
+    if args.save_baseline:
+        with open(BASELINE_PATH, "w", encoding="utf-8") as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+        print(f"Baseline saved to {BASELINE_PATH}")
+    elif os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, "r", encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+        for name, value in results.items():
+            if name in baseline and value > baseline[name] * (1 + args.tolerance):
+                failures.append(f"{name} took {value:.1f} ms, baseline is {baseline[name]:.1f} ms")
+    else:
+        failures.append(f"no baseline in {BASELINE_PATH}, run with --save_baseline to record one")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+import time
+import logging
+import argparse
+import warnings
+from typing import Optional
+import numpy as np
+from faster_whisper import WhisperModel, decode_audio
+from .utils.cpu import available_cpus
+from .utils.ffmpeg import SAMPLE_RATE
+from .utils.host_profile import DEFAULT_PROFILE_PATH, profile_key, resolve_device, \
+    save_profile_entry
+
+logger = logging.getLogger(__name__)
+
+COMPUTE_TYPES = ["int8", "int8_float32", "int8_float16", "int8_bfloat16",
+                 "int16", "float16", "bfloat16", "float32"]
+CLIP_DURATION = 30
+
+
+def synthetic_clip(duration: int = CLIP_DURATION) -> np.ndarray:
+    """
+    Generates a deterministic speech-like waveform: voiced syllables with a gliding pitch
+    and a few harmonics, separated by short pauses.
+    """
+    rng = np.random.default_rng(0)
+    time_points = np.arange(duration * SAMPLE_RATE) / SAMPLE_RATE
+    pitch = 140 + 40 * np.sin(2 * np.pi * 0.3 * time_points) + 20 * np.sin(2 * np.pi * 1.7 * time_points)
+    phase = 2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE
+    voice = sum(np.sin(harmonic * phase) / harmonic for harmonic in range(1, 6))
+
+    syllables = np.clip(np.sin(2 * np.pi * 4 * time_points), 0, None)
+    pauses = (np.sin(2 * np.pi * 0.25 * time_points) > -0.7).astype(np.float32)
+    noise = rng.normal(0, 0.01, len(time_points))
+    return (0.3 * voice * syllables * pauses + noise).astype(np.float32)
+
+
+def candidate_threads() -> list[int]:
+    cpu_count = len(available_cpus())
+    return sorted({cpu_count, max(cpu_count // 2, 1), max(cpu_count // 4, 1)}, reverse=True)
+
+
+def candidate_compute_types(device: str) -> list[str]:
+    import ctranslate2  # pylint: disable=C0415
+    supported = ctranslate2.get_supported_compute_types(device)
+    return [compute_type for compute_type in COMPUTE_TYPES if compute_type in supported]
+
+
+def benchmark(model_args: dict, audio: np.ndarray, repeat: int) -> Optional[float]:
+    """
+    Returns the fastest of `repeat` transcriptions of the audio in seconds,
+    or None if the model can't be loaded with these arguments.
+    """
+    try:
+        model = WhisperModel(**model_args)
+    except (ValueError, RuntimeError) as exc:
+        logger.warning("Skipping %s: %s", model_args, exc)
+        return None
+
+    def transcribe() -> float:
+        start = time.perf_counter()
+        segments, _ = model.transcribe(audio, language="en", temperature=0.0,
+                                       condition_on_previous_text=False)
+        list(segments)
+        return time.perf_counter() - start
+
+    warnings.filterwarnings("ignore")
+    transcribe()
+    durations = [transcribe() for _ in range(repeat)]
+    warnings.filterwarnings("default")
+    return min(durations)
+
+
+def autotune(model_name: str, device: str, compute_types: list[str], threads: list[int],
+             audio: np.ndarray, repeat: int) -> Optional[dict]:
+    results = []
+    for compute_type in compute_types:
+        for cpu_threads in threads:
+            model_args = {"model_size_or_path": model_name, "device": device,
+                          "compute_type": compute_type, "cpu_threads": cpu_threads}
+            duration = benchmark(model_args, audio, repeat)
+            if duration is None:
+                break
+            logger.info("compute_type=%-14s cpu_threads=%-3d %.2f s (%.1fx realtime)",
+                        compute_type, cpu_threads, duration, len(audio) / SAMPLE_RATE / duration)
+            results.append({"compute_type": compute_type, "cpu_threads": cpu_threads,
+                            "seconds": round(duration, 3)})
+
+    return min(results, key=lambda result: result["seconds"], default=None)
+
+
+def main(argv: Optional[list[str]] = None):
+    """
+    Entry point for `faster_auto_subtitle autotune`.
+
+    Benchmarks the model across compute types and thread counts and stores the fastest
+    configuration in the profile of this host, which is used whenever --compute_type
+    and --cpu_threads are left at their defaults.
+    """
+    parser = argparse.ArgumentParser(
+        prog="faster_auto_subtitle autotune",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--model", default="small",
+                        help="name of the Whisper model to tune")
+    parser.add_argument("--device", type=str, default="auto",
+                        choices=["cpu", "cuda", "auto"],
+                        help="Device to tune for")
+    parser.add_argument("--compute_types", type=str, default=None,
+                        help="comma-separated compute types to try, \
+                              defaults to all types supported by the device")
+    parser.add_argument("--threads", type=str, default=None,
+                        help="comma-separated CPU thread counts to try, \
+                              defaults to all, half and a quarter of the available CPUs")
+    parser.add_argument("--audio", type=str, default=None,
+                        help="audio file to benchmark on instead of the synthetic clip")
+    parser.add_argument("--repeat", type=int, default=2,
+                        help="number of timed runs per configuration, the fastest is used")
+    parser.add_argument("--profile", type=str, default=DEFAULT_PROFILE_PATH,
+                        help="file the host profile is stored in")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(encoding='utf-8', level=logging.INFO)
+
+    device = resolve_device(args.device)
+    compute_types = args.compute_types.split(',') if args.compute_types \
+        else candidate_compute_types(device)
+    if args.threads:
+        threads = [int(count) for count in args.threads.split(',')]
+    else:
+        # Threads are only used on CPU
+        threads = candidate_threads() if device == "cpu" else [0]
+
+    if args.audio is not None:
+        audio = decode_audio(args.audio, sampling_rate=SAMPLE_RATE)
+    else:
+        audio = synthetic_clip()
+
+    logger.info("Tuning %s on %s...", args.model, device)
+    best = autotune(args.model, device, compute_types, threads, audio, args.repeat)
+    if best is None:
+        logger.error("None of the configurations could be benchmarked.")
+        return 1
+
+    save_profile_entry(profile_key(args.model, device), best, args.profile)
+    logger.info("Fastest configuration: compute_type=%s, cpu_threads=%s, saved to %s",
+                best["compute_type"], best["cpu_threads"], args.profile)
+    return 0
@@ -1,7 +1,14 @@
 import argparse
-from .utils.convert import str2bool, str2timeinterval
-from faster_whisper.utils import available_models
+from .utils.convert import str2bool, str2channels, str2timeinterval
+from .utils.ipc import DEFAULT_ADDRESS
 import json
+import sys
+
+
+def available_models() -> list[str]:
+    # faster_whisper takes a while to import, only load it when the model name has to be checked
+    from faster_whisper.utils import available_models as whisper_models
+    return whisper_models()
 
 
 def main():
@@ -10,7 +17,16 @@ def main():
 
     Parses command line arguments, processes the inputs using the specified options,
     and performs transcription or translation based on the specified task.
+    `faster_auto_subtitle autotune ...` benchmarks the model to tune it for this host instead.
+    `faster_auto_subtitle translation_index ...` refreshes the stored index of Opus-MT models.
     """
+    if len(sys.argv) > 1 and sys.argv[1] == "autotune":
+        from .autotune import main as autotune
+        sys.exit(autotune(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "translation_index":
+        from .translation.model_index import main as translation_index
+        sys.exit(translation_index(sys.argv[2:]))
+
     parser = argparse.ArgumentParser(
         formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument("video", nargs="+", type=str,
@@ -19,13 +35,38 @@ def main():
     parser.add_argument("--audio_channel", default="0",
                         type=int, help="audio channel index to use")
 
+    parser.add_argument("--audio_channels", type=str2channels, default=None,
+                        help="transcribe several audio channels at once, 'all' or \
+                              comma-separated indexes (e.g. 0,2), overrides --audio_channel")
+
+    parser.add_argument("--prefetch", type=int, default=1,
+                        help="number of files to extract audio for ahead of transcription \
+                              and to mux in background (0 processes files one by one)")
+
+    parser.add_argument("--probe_cache_dir", type=str, default=None,
+                        help="directory to persist ffprobe results between runs, \
+                              keyed by file path, size and modification time")
+
     parser.add_argument("--sample_interval", type=str2timeinterval, default=None,
                         help="generate subtitles for a specific \
                               fragment of the video (e.g. 01:02:05-01:03:45)")
 
     parser.add_argument("--model", default="small",
-                        choices=available_models(),
-                        help="name of the Whisper model to use")
+                        help="name of the Whisper model to use (tiny, base, small, medium, \
+                              large-v3, turbo, distil-large-v3, ...)")
+
+    parser.add_argument("--refine_model", default=None,
+                        help="larger Whisper model that decodes again only the parts where the \
+                              segments of --model fall outside the refine thresholds")
+
+    parser.add_argument("--refine_logprob_threshold", type=float, default=-0.6,
+                        help="segments with a lower average log probability are refined")
+
+    parser.add_argument("--refine_compression_ratio_threshold", type=float, default=2.2,
+                        help="segments with a higher compression ratio are refined")
+
+    parser.add_argument("--refine_no_speech_threshold", type=float, default=0.5,
+                        help="segments with a higher no-speech probability are refined")
 
     parser.add_argument("--device", type=str, default="auto",
                         choices=["cpu", "cuda", "auto"],
@@ -35,7 +76,44 @@ def main():
         "int8", "int8_float32", "int8_float16", "int8_bfloat16",
         "int16", "float16", "bfloat16", "float32"],
                         help="Type to use for computation. \
-                              See https://opennmt.net/CTranslate2/quantization.html.")
+                              See https://opennmt.net/CTranslate2/quantization.html. \
+                              If unset, the type found by `faster_auto_subtitle autotune` is used.")
+
+    parser.add_argument("--num_workers", type=int, default=1,
+                        help="number of transcriptions the model can run in parallel, \
+                              increase it when transcribing several audio channels")
+
+    parser.add_argument("--cpu_threads", type=int, default=0,
+                        help="number of threads the model uses on CPU (0 uses the default, \
+                              or all CPUs assigned to a worker with --workers)")
+
+    parser.add_argument("--workers", type=int, default=1,
+                        help="split input files across this many processes, each with its own \
+                              model and pinned to its own set of CPUs")
+
+    parser.add_argument("--batch_size", type=int, default=0,
+                        help="split speech into chunks with VAD and transcribe them in batches \
+                              of this size (0 transcribes 30-second windows sequentially)")
+
+    parser.add_argument("--clip_batch_size", type=int, default=0,
+                        help="transcribe files shorter than 30 seconds together, \
+                              in groups of up to this many files (0 transcribes every file separately)")
+
+    parser.add_argument("--parallel_chunks", type=int, default=0,
+                        help="split long audio at silences into this many chunks and transcribe \
+                              them in separate processes, each loading its own model")
+
+    parser.add_argument("--checkpoint_dir", type=str, default=None,
+                        help="journal segments to this directory while transcribing, so that \
+                              an interrupted run resumes where it stopped instead of starting over")
+
+    parser.add_argument("--transcript_cache_dir", type=str, default=None,
+                        help="directory to cache transcriptions in, re-running on the same audio \
+                              with the same model parameters reuses the stored subtitles")
+
+    parser.add_argument("--transcript_cache_size", type=int, default=1024,
+                        help="maximum size of the transcription cache in megabytes, \
+                              least recently used entries are removed first")
 
     parser.add_argument("--output_type", type=str, default="all",
                         choices=["video", "srt", "all"],
@@ -44,6 +122,28 @@ def main():
     parser.add_argument("--output_dir", "-o", type=str,
                         default=".", help="directory to save the output")
 
+    parser.add_argument("--burn_segments", type=int, default=1,
+                        help="split the video at keyframes into this many pieces and burn \
+                              hard subtitles into them in parallel ffmpeg processes")
+
+    parser.add_argument("--video_preset", type=str, default=None,
+                        choices=["ultrafast", "superfast", "veryfast", "faster", "fast",
+                                 "medium", "slow", "slower", "veryslow"],
+                        help="encoder preset used when burning hard subtitles")
+
+    parser.add_argument("--ffmpeg_threads", type=int, default=0,
+                        help="threads per ffmpeg encoding process (0 picks automatically)")
+
+    parser.add_argument("--workspace_dir", type=str, default=None,
+                        help="directory for intermediate files, defaults to the system temp directory")
+
+    parser.add_argument("--tmpfs", type=str2bool, default=False,
+                        help="keep intermediate files in RAM (/dev/shm) when there is enough space")
+
+    parser.add_argument("--tmpfs_min_free", type=int, default=512,
+                        help="megabytes that must stay free on /dev/shm, \
+                              otherwise intermediate files are written to disk")
+
     parser.add_argument("--subtitle_type", type=str, default="hard",
                         choices=["hard", "soft"],
                         help="whether to encode subtitles in video stream or add them as a subtitle track")
@@ -72,8 +172,24 @@ def main():
                         help="model parameter, tweak to increase accuracy")
 
     parser.add_argument("--translator_mode", type=str, default="opusmt",
-                        choices=["opusmt", "deep-translator"],
-                        help="Which translation mode to use: opusmt, or deep-translator")
+                        choices=["opusmt", "opusmt-ct2", "deep-translator"],
+                        help="Which translation mode to use: opusmt, opusmt-ct2 (Opus-MT models \
+                              converted to CTranslate2, faster on CPU), or deep-translator")
+
+    parser.add_argument("--translator_cache_dir", type=str, default=None,
+                        help="Where Opus-MT models converted for opusmt-ct2 are stored, \
+                              defaults to ~/.cache/faster_auto_subtitle/opus-mt-ct2")
+
+    parser.add_argument("--translation_memory", type=str, default=None,
+                        help="SQLite file to remember translated sentences in, sentences \
+                              translated before by the same model are not translated again")
+
+    parser.add_argument("--translation_memory_size", type=int, default=100000,
+                        help="maximum number of sentences in the translation memory, \
+                              least recently used entries are removed first")
+
+    parser.add_argument("--translator_compute_type", type=str, default="auto",
+                        help="CTranslate2 compute type for opusmt-ct2 (e.g. int8, float16)")
 
     parser.add_argument("--deep_translator_backend", type=str, default="google",
                         choices=["google", "mymemory", "deepl", "qcri", "linguee", "pons", "yandex", "microsoft", "papago", "libre", "tencent", "baidu"],
@@ -82,9 +198,45 @@ def main():
     parser.add_argument("--deep_translator_kwargs", type=str, default="{}",
                         help="Extra kwargs for deep-translator backend as a JSON string (e.g. {\"api_key\": \"yourkey\"})")
 
+    parser.add_argument("--live", type=str2bool, default=False,
+                        help="caption a live stream continuously: the video argument is read as it \
+                              arrives from stdin (-), a FIFO or an URL, and cues are written as soon \
+                              as they are final")
+
+    parser.add_argument("--live_format", type=str, default="srt", choices=["srt", "vtt"],
+                        help="subtitle format written in live mode")
+
+    parser.add_argument("--live_output", type=str, default=None,
+                        help="file to write live cues to (- for stdout), \
+                              defaults to a file named after the source in output_dir")
+
+    parser.add_argument("--live_step", type=float, default=2.0,
+                        help="seconds of new audio collected before the live window is transcribed again")
+
+    parser.add_argument("--live_window", type=float, default=15.0,
+                        help="longest live window in seconds, segments are finalized once it is exceeded")
+
+    parser.add_argument("--server", type=str, nargs="?", const=DEFAULT_ADDRESS, default=None,
+                        help="send the job to a running faster_auto_subtitle_server listening on \
+                              this Unix socket path or host:port instead of loading the models here")
+
     args = parser.parse_args().__dict__
+    for name in ("model", "refine_model"):
+        if args[name] not in (None, parser.get_default("model")) and \
+                args[name] not in available_models():
+            parser.error(f"argument --{name}: invalid choice: '{args[name]}' "
+                         f"(choose from {', '.join(available_models())})")
     args["deep_translator_kwargs"] = json.loads(args["deep_translator_kwargs"])
 
+    server = args.pop("server")
+    if server is not None and args["live"]:
+        parser.error("--live can't be combined with --server")
+    if args["live"] and args["workers"] > 1:
+        parser.error("--live can't be combined with --workers")
+    if server is not None:
+        from .client import run_job
+        sys.exit(run_job(args, server))
+
     from .main import process
     process(args)
 
@@ -0,0 +1,55 @@
+import os
+import logging
+from tqdm import tqdm
+from tqdm.contrib.logging import logging_redirect_tqdm
+from .utils.ipc import MessageWriter, connect, read_messages
+
+logger = logging.getLogger(__name__)
+
+# The server may run in another working directory
+PATH_ARGS = ("output_dir", "probe_cache_dir", "transcript_cache_dir", "workspace_dir",
+             "checkpoint_dir", "translator_cache_dir", "translation_memory")
+
+
+def run_job(args: dict, address: str) -> int:
+    """
+    Sends a job to a running server and shows its logs and progress.
+
+    Returns the exit code for the command line: 0 if the job succeeded, 1 otherwise.
+    """
+    logging.basicConfig(encoding='utf-8', level=logging.INFO)
+
+    args = dict(args, video=[os.path.abspath(path) for path in args["video"]])
+    for name in PATH_ARGS:
+        if args.get(name) is not None:
+            args[name] = os.path.abspath(args[name])
+
+    try:
+        connection = connect(address)
+    except OSError as exc:
+        logger.error("Unable to connect to server at %s: %s", address, exc)
+        return 1
+
+    pbar = None
+    with connection, connection.makefile("rwb") as stream, logging_redirect_tqdm():
+        MessageWriter(stream).send({"type": "job", "args": args})
+        try:
+            for message in read_messages(stream):
+                if message["type"] == "log":
+                    logging.getLogger(message["name"]).log(message["level"], "%s",
+                                                           message["message"])
+                elif message["type"] == "start":
+                    pbar = tqdm(total=message["files"], unit=" files")
+                elif message["type"] == "progress" and pbar is not None:
+                    pbar.update(1)
+                elif message["type"] == "done":
+                    return 0
+                elif message["type"] == "error":
+                    logger.error("Job failed: %s", message["message"])
+                    return 1
+        finally:
+            if pbar is not None:
+                pbar.close()
+
+    logger.error("Server closed the connection before the job was finished.")
+    return 1
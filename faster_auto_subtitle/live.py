@@ -0,0 +1,209 @@
+import os
+import sys
+import logging
+import threading
+import subprocess
+from contextlib import ExitStack
+from typing import Optional
+import numpy as np
+from faster_whisper.transcribe import Segment
+from .utils.ffmpeg import open_audio_stream, pcm_to_float, SAMPLE_RATE
+from .utils.files import SubtitleStream, filename
+from .utils.whisper import WhisperAI, shift_segment
+
+logger = logging.getLogger(__name__)
+
+# Size of a single read from ffmpeg, in seconds of audio
+READ_DURATION = 0.1
+# Segments of consecutive passes starting closer than this, in seconds, are the same segment
+AGREEMENT_TOLERANCE = 0.5
+# Audio kept when a window without speech is dropped, so that a word being spoken is not cut
+SILENCE_KEEP_DURATION = 1.0
+
+
+class AudioReader:
+    """
+    Reads PCM from ffmpeg in a background thread, so that the audio keeps flowing
+    while Whisper is busy with the previous window.
+    """
+
+    def __init__(self, process: subprocess.Popen):
+        self.process = process
+        self.chunks: list[bytes] = []
+        self.size = 0
+        self.finished = False
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.read, name="live-reader", daemon=True)
+        self.thread.start()
+
+    def read(self) -> None:
+        read_size = int(READ_DURATION * SAMPLE_RATE) * 2
+        while True:
+            data = self.process.stdout.read(read_size)
+            if not data:
+                break
+            with self.condition:
+                self.chunks.append(data)
+                self.size += len(data)
+                self.condition.notify()
+
+        with self.condition:
+            self.finished = True
+            self.condition.notify()
+
+    def take(self, min_duration: float) -> Optional[np.ndarray]:
+        """
+        Waits for at least `min_duration` seconds of new audio and returns all audio received
+        since the last call. Returns None once the stream has ended and everything was taken.
+        """
+        min_size = int(min_duration * SAMPLE_RATE) * 2
+        with self.condition:
+            self.condition.wait_for(lambda: self.finished or self.size >= min_size)
+            data = b"".join(self.chunks)
+            self.chunks.clear()
+            self.size = 0
+            finished = self.finished
+
+        if finished and len(data) == 0:
+            return None
+        return pcm_to_float(data[:len(data) // 2 * 2])
+
+
+class LiveCaptioner:
+    """
+    Captions a continuous audio stream by running Whisper over a sliding window.
+
+    Every `step` seconds the new audio is appended to the window and the whole window is
+    transcribed again. A segment is finalized once two consecutive passes agree on it and it is
+    followed by another segment; finalized segments are written out and cut from the window.
+    If the window grows longer than `window` seconds, all segments but the last one are
+    finalized regardless, which bounds the delay.
+    """
+
+    def __init__(self, transcribe_model: WhisperAI, output: SubtitleStream, step: float,
+                 window: float, target_language: str = 'en', translate_model=None):
+        self.transcribe_model = transcribe_model
+        self.output = output
+        self.step = step
+        self.window = window
+        self.target_language = target_language
+        self.translate_model = translate_model
+        self.audio = np.zeros(0, dtype=np.float32)
+        # Start of the window in the stream, in seconds
+        self.offset = 0.0
+        self.previous: list[Segment] = []
+        self.language: Optional[str] = transcribe_model.transcribe_args.get("language")
+        self.prompt: Optional[str] = None
+
+    def run(self, reader: AudioReader) -> None:
+        try:
+            while True:
+                audio = reader.take(self.step)
+                if audio is None:
+                    break
+                self.audio = np.concatenate([self.audio, audio])
+                self.process_window(final=False)
+        except KeyboardInterrupt:
+            logger.info("Interrupted, finalizing the remaining audio.")
+
+        self.process_window(final=True)
+
+    def process_window(self, final: bool) -> None:
+        duration = len(self.audio) / SAMPLE_RATE
+        if duration == 0:
+            return
+
+        transcribe_args = {}
+        if self.language is not None:
+            transcribe_args["language"] = self.language
+        if self.prompt is not None and self.transcribe_model.transcribe_args.get("initial_prompt") is None:
+            transcribe_args["initial_prompt"] = self.prompt
+
+        segments, language = self.transcribe_model.transcribe_window(self.audio, **transcribe_args)
+        segments = [segment for segment in segments
+                    if segment.text.strip() != '' and segment.start < duration]
+
+        if final:
+            count = len(segments)
+        else:
+            count = self.agreed_count(segments)
+            if duration > self.window:
+                count = max(count, len(segments) - 1, min(len(segments), 1))
+
+        if count == 0:
+            self.previous = segments
+            if len(segments) == 0 and duration > self.window:
+                self.cut(duration - SILENCE_KEEP_DURATION)
+            return
+
+        if self.language is None:
+            self.language = language
+        cut = min(segments[count - 1].end, duration)
+        # Only finalized segments are refined, within the audio that is cut from the window
+        finalized = list(self.transcribe_model.refined(self.audio[:int(cut * SAMPLE_RATE)],
+                                                       segments[:count], self.language,
+                                                       log_summary=False))
+        self.emit([shift_segment(segment, self.offset) for segment in finalized])
+        if len(finalized) > 0:
+            self.prompt = finalized[-1].text.strip()
+
+        self.previous = [shift_segment(segment, -cut) for segment in segments[count:]]
+        self.cut(cut)
+
+    def agreed_count(self, segments: list[Segment]) -> int:
+        count = 0
+        # The last segment may still be cut off by the end of the window
+        for current, previous in zip(segments[:-1], self.previous):
+            if current.text.strip() != previous.text.strip() or \
+                    abs(current.start - previous.start) > AGREEMENT_TOLERANCE:
+                break
+            count += 1
+        return count
+
+    def cut(self, seconds: float) -> None:
+        self.audio = self.audio[int(seconds * SAMPLE_RATE):]
+        self.offset += seconds
+
+    def emit(self, segments: list[Segment]) -> None:
+        if self.translate_model is not None:
+            translated = self.translate_model.translate_segments(segments, self.language,
+                                                                 self.target_language)
+            if translated is not None:
+                segments = translated
+            else:
+                logger.warning("Translation from %s to %s is not available, writing %s cues.",
+                               self.language, self.target_language, self.language)
+                self.translate_model = None
+
+        self.output.write(segments)
+
+
+def run_live(source: str, audio_channel: int, transcribe_model: WhisperAI, translate_model,
+             target_language: str, output_dir: str, subtitle_format: str,
+             output_path: Optional[str], step: float, window: float) -> None:
+    """
+    Captions audio read continuously from `source` ("-" for stdin, a FIFO or an URL),
+    writing finalized cues to `output_path` ("-" for stdout) as they stabilize.
+    """
+    name = "live" if source == '-' else filename(source.rstrip('/')) or "live"
+    if output_path is None:
+        output_path = os.path.join(output_dir, f"{name}.{subtitle_format}")
+
+    logger.info("Captioning %s live, writing cues to %s", source,
+                "stdout" if output_path == '-' else output_path)
+    process = open_audio_stream(source, audio_channel)
+    with ExitStack() as stack:
+        if output_path == '-':
+            output_file = sys.stdout
+        else:
+            output_file = stack.enter_context(open(output_path, "w", encoding="utf-8"))
+
+        captioner = LiveCaptioner(transcribe_model, SubtitleStream(output_file, subtitle_format),
+                                  step, window, target_language, translate_model)
+        try:
+            captioner.run(AudioReader(process))
+        finally:
+            if process.poll() is None:
+                process.terminate()
+            process.wait()
+            process.stdout.close()
@@ -1,17 +1,42 @@
 import os
+import queue
 import warnings
 import logging
-from typing import Optional
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, Union
+import numpy as np
+from faster_whisper import WhisperModel
+from tqdm import tqdm
 from .models.subtitles import Subtitles, SegmentsIterable
-from .utils.files import filename, write_srt
-from .utils.ffmpeg import get_audio, add_subtitles, preprocess_audio, file_has_audio
-from .utils.whisper import WhisperAI
+from .utils.files import filename, save_srt
+from .utils.ffmpeg import get_audio, get_audio_tracks, add_subtitles, preprocess_audio, \
+    file_has_audio, select_audio_channels, SAMPLE_RATE
+from .utils.cpu import split_cpus, pin_to_cpus
+from .utils.host_profile import apply_host_profile
+from .utils.probe import set_probe_cache_dir
+from .utils.transcript_cache import TranscriptCache
+from .utils.translation_memory import TranslationMemory
+from .utils.whisper import WhisperAI, CLIP_MAX_DURATION
+from .utils.workspace import Workspace
 from .utils.constants import LANGUAGE_CODES
 
 logger = logging.getLogger(__name__)
 
 
-def process(args: dict):
+def process(args: dict, models=None):
+    """
+    Runs a job described by parsed command line arguments.
+
+    `models` is an optional store of already loaded models (see `server.ModelStore`),
+    which is used instead of loading the models for this job only.
+    """
+    workers: int = args.pop("workers", 1)
+    if workers > 1:
+        process_sharded(args, workers)
+        return
+
     model_name: str = args.pop("model")
     language: str = args.pop("language")
     sample_interval: list = args.pop("sample_interval")
@@ -20,6 +45,14 @@ def process(args: dict):
     deep_translator_backend: str = args.pop("deep_translator_backend", "google")
     # Collect extra deep-translator kwargs if present
     deep_translator_kwargs = args.pop("deep_translator_kwargs", {})
+    ct2_translator_args = {
+        "cache_dir": args.pop("translator_cache_dir", None),
+        "compute_type": args.pop("translator_compute_type", "auto")
+    }
+    translation_memory_args = {
+        "path": args.pop("translation_memory", None),
+        "max_entries": args.pop("translation_memory_size", 100000)
+    }
 
     logging.basicConfig(encoding='utf-8', level=logging.INFO)
 
@@ -40,84 +73,355 @@ def process(args: dict):
     output_args = {
         "output_dir": args.pop("output_dir"),
         "output_type": args.pop("output_type"),
-        "subtitle_type": args.pop("subtitle_type")
+        "subtitle_type": args.pop("subtitle_type"),
+        "burn_segments": args.pop("burn_segments", 1),
+        "video_preset": args.pop("video_preset", None),
+        "ffmpeg_threads": args.pop("ffmpeg_threads", 0)
     }
+    workspace = Workspace(args.pop("workspace_dir", None), args.pop("tmpfs", False),
+                          args.pop("tmpfs_min_free", 0) * 1024 * 1024)
 
     paths_to_process = args.pop('video')
     audio_channel = args.pop('audio_channel')
-    model_args = {
+    audio_channels = args.pop('audio_channels', None)
+    if audio_channels is None:
+        audio_channels = [audio_channel]
+    prefetch = args.pop('prefetch', 1)
+    clip_batch_size = args.pop('clip_batch_size', 0)
+    on_file_done = args.pop('on_file_done', None)
+    live = args.pop("live", False)
+    live_args = {
+        "subtitle_format": args.pop("live_format", "srt"),
+        "output_path": args.pop("live_output", None),
+        "step": args.pop("live_step", 2.0),
+        "window": args.pop("live_window", 15.0)
+    }
+    set_probe_cache_dir(args.pop('probe_cache_dir', None))
+    base_model_args = {
         "model_size_or_path": model_name,
         "device": args.pop("device"),
-        "compute_type": args.pop("compute_type")
+        "compute_type": args.pop("compute_type"),
+        "num_workers": args.pop("num_workers", 1),
+        "cpu_threads": args.pop("cpu_threads", 0)
+    }
+    model_args = apply_host_profile(base_model_args)
+    refine_args = {
+        "model": args.pop("refine_model", None),
+        "avg_logprob": args.pop("refine_logprob_threshold", -0.6),
+        "compression_ratio": args.pop("refine_compression_ratio_threshold", 2.2),
+        "no_speech_prob": args.pop("refine_no_speech_threshold", 0.5)
     }
-    transcribe_model = WhisperAI(model_args, args)
+    parallel_chunks = args.pop("parallel_chunks", 0)
+    transcript_cache_dir = args.pop("transcript_cache_dir", None)
+    transcript_cache_size = args.pop("transcript_cache_size", 1024)
+    transcript_cache = None
+    if transcript_cache_dir is not None:
+        transcript_cache = TranscriptCache(transcript_cache_dir, transcript_cache_size * 1024 * 1024)
+    batch_size = args.pop("batch_size", 0)
+    model = models.whisper_model(model_args) if models is not None else None
+    checkpoint_dir = args.pop("checkpoint_dir", None)
+    refine_model = None
+    if refine_args["model"] is not None:
+        refine_model_args = apply_host_profile(dict(base_model_args,
+                                                    model_size_or_path=refine_args["model"]))
+        refine_model = models.whisper_model(refine_model_args) if models is not None \
+            else WhisperModel(**refine_model_args)
+    transcribe_model = WhisperAI(model_args, args, parallel_chunks, transcript_cache, batch_size,
+                                 model, checkpoint_dir, refine_model, refine_args)
     translate_model = None
     if target_language != 'en':
         supported_languages = LANGUAGE_CODES
+        if models is not None:
+            translate_model = models.translator(translator_mode, deep_translator_backend,
+                                                deep_translator_kwargs, model_args['device'],
+                                                ct2_translator_args, translation_memory_args)
+        else:
+            translation_memory = None
+            if translation_memory_args["path"] is not None:
+                translation_memory = TranslationMemory(**translation_memory_args)
+            translate_model = load_translator(translator_mode, deep_translator_backend,
+                                              deep_translator_kwargs, model_args['device'],
+                                              ct2_translator_args, translation_memory)
         if translator_mode == 'deep-translator':
-            from .translation.deep_translator import DeepTranslatorWrapper
-            translate_model = DeepTranslatorWrapper(mode=deep_translator_backend, **deep_translator_kwargs)
             supported_languages = list(translate_model.translator_class().get_supported_languages(as_dict=True).values())
-        else:
-            from .translation.opusmt import OpusMTWrapper
-            translate_model = OpusMTWrapper(device=model_args['device'])
         assert target_language in supported_languages, f"Target language '{target_language}' not supported. Use one of: {', '.join(supported_languages)}"
 
     os.makedirs(output_args["output_dir"], exist_ok=True)
-    for path_to_process in paths_to_process:
-        process_path(audio_channel, language, output_args, path_to_process, sample_interval,
-                     target_language, transcribe_model, translate_model)
+    if live:
+        from .live import run_live
+        if len(paths_to_process) > 1:
+            logger.warning("Live mode captions a single source, ignoring %s.",
+                           ", ".join(paths_to_process[1:]))
+        try:
+            run_live(paths_to_process[0], audio_channel, transcribe_model, translate_model,
+                     target_language, output_args["output_dir"], **live_args)
+        finally:
+            transcribe_model.close()
+            log_translation_memory_stats(translate_model)
+        return
 
+    files_to_process = [file_name for path_to_process in paths_to_process
+                        for file_name in collect_files(path_to_process)]
+    try:
+        with workspace:
+            output_args["workspace"] = workspace
+            process_files(files_to_process, audio_channels, language, output_args, sample_interval,
+                          target_language, transcribe_model, translate_model, prefetch,
+                          clip_batch_size, on_file_done)
+    finally:
+        transcribe_model.close()
+        log_translation_memory_stats(translate_model)
+
+
+def process_sharded(args: dict, workers: int) -> None:
+    """
+    Shards the input files across `workers` processes, each with its own model instances.
+
+    Every worker is pinned to a disjoint set of CPUs, kept within one NUMA node where possible,
+    and uses as many CTranslate2 threads as it has CPUs unless `cpu_threads` is set.
+    Progress of all workers is reported in a single progress bar.
+    """
+    logging.basicConfig(encoding='utf-8', level=logging.INFO)
+
+    files_to_process = [file_name for path_to_process in args.pop('video')
+                        for file_name in collect_files(path_to_process)]
+    shards = [files_to_process[index::workers] for index in range(workers)]
+    shards = [shard for shard in shards if len(shard) > 0]
+    if len(shards) == 0:
+        return
 
-def process_path(audio_channel, language, output_args, path_to_process, sample_interval,
-                 target_language, transcribe_model, translate_model):
+    context = multiprocessing.get_context("spawn")
+    progress = context.Queue()
+    processes = [context.Process(target=run_worker, args=(dict(args, video=shard), cpus, progress),
+                                 name=f"worker-{index}")
+                 for index, (shard, cpus) in enumerate(zip(shards, split_cpus(len(shards))))]
+    for worker in processes:
+        worker.start()
+
+    with tqdm(total=len(files_to_process), unit=" files") as pbar:
+        while pbar.n < len(files_to_process):
+            try:
+                progress.get(timeout=1)
+            except queue.Empty:
+                if not any(worker.is_alive() for worker in processes):
+                    break
+                continue
+            pbar.update(1)
+
+    for worker in processes:
+        worker.join()
+        if worker.exitcode != 0:
+            logger.error("%s exited with code %s.", worker.name, worker.exitcode)
+
+
+def run_worker(args: dict, cpus: list[int], progress) -> None:
+    # Individual progress bars of the workers would garble the aggregated one
+    os.environ["TQDM_DISABLE"] = "1"
+    pin_to_cpus(cpus)
+    if not args.get("cpu_threads"):
+        args["cpu_threads"] = len(cpus)
+    args["on_file_done"] = progress.put
+    process(args)
+
+
+def load_translator(translator_mode: str, deep_translator_backend: str,
+                    deep_translator_kwargs: dict, device: str,
+                    ct2_translator_args: Optional[dict] = None,
+                    translation_memory: Optional[TranslationMemory] = None):
+    if translator_mode == 'deep-translator':
+        from .translation.deep_translator import DeepTranslatorWrapper
+        return DeepTranslatorWrapper(mode=deep_translator_backend, memory=translation_memory,
+                                     **deep_translator_kwargs)
+
+    if translator_mode == 'opusmt-ct2':
+        from .translation.opusmt_ct2 import OpusMTCT2Wrapper
+        return OpusMTCT2Wrapper(device=device, memory=translation_memory,
+                                **(ct2_translator_args or {}))
+
+    from .translation.opusmt import OpusMTWrapper
+    return OpusMTWrapper(device=device, memory=translation_memory)
+
+
+def log_translation_memory_stats(translate_model) -> None:
+    if translate_model is not None and translate_model.memory is not None:
+        translate_model.memory.log_stats()
+
+
+def collect_files(path_to_process: str) -> list[str]:
     if not os.path.exists(path_to_process):
         logger.error("File %s does not exist.", path_to_process)
-        return
+        return []
 
     if not os.path.isdir(path_to_process):
-        process_file(audio_channel, language, output_args, sample_interval, target_language,
-                     transcribe_model, translate_model, path_to_process)
-        return
+        return [path_to_process]
 
     logger.info("Processing all files in directory %s", path_to_process)
-    for file_name in os.listdir(path_to_process):
-        process_file(audio_channel, language, output_args, sample_interval, target_language,
-                     transcribe_model, translate_model, os.path.join(path_to_process, file_name))
-
-
-def process_file(audio_channel, language, output_args, sample_interval, target_language,
-                 transcribe_model, translate_model, file_name):
+    return [os.path.join(path_to_process, file_name) for file_name in os.listdir(path_to_process)]
+
+
+def process_files(files: list[str], audio_channels, language, output_args, sample_interval,
+                  target_language, transcribe_model, translate_model, prefetch: int = 1,
+                  clip_batch_size: int = 0, on_file_done: Optional[Callable[[str], None]] = None):
+    """
+    Runs files through a three-stage pipeline: audio extraction, speech recognition and muxing.
+
+    Extraction of the next `prefetch` files and muxing of up to `prefetch` previous files
+    run in background threads while the current file is being transcribed.
+    With `prefetch` set to 0 the files are processed strictly one after another.
+    If `clip_batch_size` is set, clips shorter than 30 seconds are collected and transcribed
+    together in groups of up to `clip_batch_size` files.
+    `on_file_done` is called with the name of every file once it is saved or skipped.
+    """
+    pending_files = iter(files)
+    extracted: deque = deque()
+    muxing: deque = deque()
+    clips: list = []
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="extract") as extractor, \
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix="mux") as muxer:
+
+        def schedule_extraction(limit: int) -> None:
+            while len(extracted) < limit:
+                file_name = next(pending_files, None)
+                if file_name is None:
+                    return
+                extracted.append((file_name, extractor.submit(
+                    load_audio, file_name, audio_channels, sample_interval)))
+
+        def submit_result(file_name: str, tracks: list) -> None:
+            future = muxer.submit(save_result, file_name, tracks, sample_interval, output_args)
+            if on_file_done is not None:
+                future.add_done_callback(lambda _: on_file_done(file_name))
+            muxing.append(future)
+            while len(muxing) > prefetch:
+                muxing.popleft().result()
+
+        def flush_clips() -> None:
+            if len(clips) == 0:
+                return
+            clip_tracks = perform_clip_tasks([audio for _, audio in clips], language,
+                                             target_language, transcribe_model, translate_model)
+            for (file_name, _), tracks in zip(clips, clip_tracks):
+                submit_result(file_name, tracks)
+            clips.clear()
+
+        while True:
+            schedule_extraction(1)
+            if not extracted:
+                break
+
+            file_name, audio_future = extracted.popleft()
+            audio_tracks = audio_future.result()
+            schedule_extraction(prefetch)
+            if audio_tracks is None:
+                if on_file_done is not None:
+                    on_file_done(file_name)
+                continue
+
+            if clip_batch_size > 0 and is_short_clip(audio_tracks):
+                clips.append((file_name, audio_tracks[0][1]))
+                if len(clips) >= clip_batch_size:
+                    flush_clips()
+                continue
+
+            tracks = perform_tasks(file_name, audio_tracks, language, target_language,
+                                   transcribe_model, translate_model)
+            submit_result(file_name, tracks)
+
+        flush_clips()
+        while muxing:
+            muxing.popleft().result()
+
+
+def load_audio(file_name: str, audio_channels: Union[str, list[int]],
+               sample_interval: Optional[list]) -> Optional[list[tuple[int, Union[str, np.ndarray]]]]:
     if not file_has_audio(file_name):
         logger.info("File %s has no audio, skipping.", file_name)
-        return
+        return None
+
+    channels = select_audio_channels(file_name, audio_channels)
+    if len(channels) == 0:
+        logger.info("File %s has none of the selected audio channels, skipping.", file_name)
+        return None
+
+    if len(channels) > 1:
+        return list(zip(channels, get_audio_tracks(file_name, channels, sample_interval)))
 
     if file_name.endswith('.wav'):
-        audio = preprocess_audio(file_name, audio_channel, sample_interval)
-    else:
-        audio = get_audio(file_name, audio_channel, sample_interval)
+        return [(channels[0], preprocess_audio(file_name, channels[0], sample_interval))]
 
-    transcribed, translated = perform_task(file_name, audio, language, target_language,
-                                           transcribe_model, translate_model)
-    save_result(file_name, transcribed, translated, sample_interval, output_args)
+    return [(channels[0], get_audio(file_name, channels[0], sample_interval))]
 
 
-def save_result(video: str, transcribed: Subtitles, translated: Optional[Subtitles], sample_interval: list,
-                output_args: dict[str, str]) -> None:
+def save_result(video: str, tracks: list[tuple[Subtitles, Optional[Subtitles]]], sample_interval: list,
+                output_args: dict) -> None:
     if output_args["output_type"] == 'all' or output_args["output_type"] == 'srt':
         logger.info('Saving subtitle files...')
-        save_subtitles(video, transcribed, output_args["output_dir"], translated is not None)
+        for transcribed, translated in tracks:
+            save_subtitles(video, transcribed, output_args["output_dir"], translated is not None)
 
-        if translated is not None:
-            save_subtitles(video, translated, output_args["output_dir"], translated is not None)
+            if translated is not None:
+                save_subtitles(video, translated, output_args["output_dir"], translated is not None)
 
     if output_args["output_type"] == 'srt':
         return
 
-    add_subtitles(video, transcribed, translated, sample_interval, output_args)
-
-
-def perform_task(video: str, audio: str, language: str, target_language: str,
+    add_subtitles(video, tracks, sample_interval, output_args)
+
+
+def is_short_clip(audio_tracks: list[tuple[int, Union[str, np.ndarray]]]) -> bool:
+    if len(audio_tracks) != 1 or not isinstance(audio_tracks[0][1], np.ndarray):
+        return False
+    return len(audio_tracks[0][1]) <= CLIP_MAX_DURATION * SAMPLE_RATE
+
+
+def perform_clip_tasks(clips: list[np.ndarray], language: str, target_language: str,
+                       transcribe_model: WhisperAI,
+                       translate_model = None) -> list[list[tuple[Subtitles, Optional[Subtitles]]]]:
+    logger.info("Generating subtitles for %d short clips...", len(clips))
+    clip_tracks = []
+    for segments, clip_language in transcribe_model.transcribe_clips(clips):
+        transcribed = Subtitles(SegmentsIterable(segments), clip_language)
+        translated = None
+        if target_language != 'en' and translate_model is not None:
+            translated = translate_subtitles(transcribed, language, target_language, translate_model)
+        clip_tracks.append([(transcribed, translated)])
+    return clip_tracks
+
+
+def perform_tasks(video: str, audio_tracks: list[tuple[int, Union[str, np.ndarray]]],
+                  language: str, target_language: str, transcribe_model: WhisperAI,
+                  translate_model = None) -> list[tuple[Subtitles, Optional[Subtitles]]]:
+    if len(audio_tracks) == 1:
+        transcribed, translated = perform_task(video, audio_tracks[0][1], language, target_language,
+                                               transcribe_model, translate_model)
+        # Segments are generated lazily, finish the recognition before handing them over
+        list(transcribed.segments)
+        return [(transcribed, translated)]
+
+    def transcribe_track(audio_track: tuple[int, Union[str, np.ndarray]]) -> Subtitles:
+        channel, audio = audio_track
+        subtitles = get_subtitles(video, audio, transcribe_model)
+        subtitles.track = channel
+        list(subtitles.segments)
+        return subtitles
+
+    # Audio tracks are transcribed concurrently, translation runs afterwards one track at a time
+    with ThreadPoolExecutor(max_workers=len(audio_tracks), thread_name_prefix="asr") as executor:
+        transcribed_tracks = list(executor.map(transcribe_track, audio_tracks))
+
+    tracks = []
+    for transcribed in transcribed_tracks:
+        translated = None
+        if target_language != 'en' and translate_model is not None:
+            translated = translate_subtitles(transcribed, language, target_language, translate_model)
+            if translated is not None:
+                translated.track = transcribed.track
+        tracks.append((transcribed, translated))
+    return tracks
+
+
+def perform_task(video: str, audio: Union[str, np.ndarray], language: str, target_language: str,
                  transcribe_model: WhisperAI,
                  translate_model = None) -> tuple[Subtitles, Optional[Subtitles]]:
     transcribed = get_subtitles(video, audio, transcribe_model)
@@ -153,22 +457,25 @@ def translate_subtitles(subtitles: Subtitles, source_lang: str, target_lang: str
 
 def save_subtitles(path: str, subtitles: Subtitles, output_dir: str,
                    use_language_in_output: bool) -> None:
+    name = filename(path)
+    if subtitles.track is not None:
+        name = f"{name}.a{subtitles.track}"
+
     if use_language_in_output:
         subtitles.output_path = os.path.join(
-            output_dir, f"{filename(path)}.{subtitles.language}.srt")
+            output_dir, f"{name}.{subtitles.language}.srt")
     else:
         subtitles.output_path = os.path.join(
-            output_dir, f"{filename(path)}.srt")
+            output_dir, f"{name}.srt")
 
     logger.info('Saving to path %s', subtitles.output_path)
-    with open(subtitles.output_path, "w", encoding="utf-8") as srt:
-        write_srt(subtitles.segments, file=srt)
+    save_srt(subtitles.segments, subtitles.output_path)
 
 
-def get_subtitles(source_path: str, audio_path: str, model: WhisperAI) -> Subtitles:
+def get_subtitles(source_path: str, audio: Union[str, np.ndarray], model: WhisperAI) -> Subtitles:
     logger.info("Generating subtitles for %s... This might take a while.",
                 filename(source_path))
 
-    segments, language = model.transcribe(audio_path)
+    segments, language = model.transcribe(audio)
 
     return Subtitles(segments=SegmentsIterable(segments), language=language)
@@ -46,6 +46,7 @@ class Subtitles:
     segments: SegmentsIterable[Segment]
     language: str
     output_path: Optional[str] = None
+    track: Optional[int] = None
 
     def __init__(self, segments: SegmentsIterable[Segment], language: str):
         self.language = language
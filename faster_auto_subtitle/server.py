@@ -0,0 +1,166 @@
+import os
+import json
+import socket
+import logging
+import argparse
+import threading
+import socketserver
+from faster_whisper import WhisperModel
+from .main import process, collect_files, load_translator
+from .utils.translation_memory import TranslationMemory
+from .utils.ipc import DEFAULT_ADDRESS, MessageWriter, parse_address, read_messages
+
+logger = logging.getLogger(__name__)
+
+
+class ModelStore:
+    """
+    Keeps Whisper models and translators loaded between jobs.
+
+    Models are keyed by the arguments they were created with, so jobs with the same
+    options share one instance.
+    """
+
+    def __init__(self):
+        self.whisper_models: dict[str, WhisperModel] = {}
+        self.translators: dict[str, object] = {}
+        self.lock = threading.Lock()
+
+    def whisper_model(self, model_args: dict) -> WhisperModel:
+        key = json.dumps(model_args, sort_keys=True)
+        with self.lock:
+            if key not in self.whisper_models:
+                logger.info("Loading Whisper model %s...", model_args["model_size_or_path"])
+                self.whisper_models[key] = WhisperModel(**model_args)
+            return self.whisper_models[key]
+
+    def translator(self, translator_mode: str, deep_translator_backend: str,
+                   deep_translator_kwargs: dict, device: str, ct2_translator_args: dict,
+                   translation_memory_args: dict):
+        if translator_mode == 'deep-translator':
+            key = [translator_mode, deep_translator_backend, deep_translator_kwargs]
+        elif translator_mode == 'opusmt-ct2':
+            key = [translator_mode, device, ct2_translator_args]
+        else:
+            key = [translator_mode, device]
+        key = json.dumps(key + [translation_memory_args], sort_keys=True)
+        with self.lock:
+            if key not in self.translators:
+                translation_memory = None
+                if translation_memory_args["path"] is not None:
+                    translation_memory = TranslationMemory(**translation_memory_args)
+                self.translators[key] = load_translator(translator_mode, deep_translator_backend,
+                                                        deep_translator_kwargs, device,
+                                                        ct2_translator_args, translation_memory)
+            return self.translators[key]
+
+
+class ForwardingHandler(logging.Handler):
+    def __init__(self, writer: MessageWriter):
+        super().__init__(logging.INFO)
+        self.writer = writer
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.writer.send({"type": "log", "name": record.name, "level": record.levelno,
+                          "message": record.getMessage()})
+
+
+class JobHandler(socketserver.StreamRequestHandler):
+    """
+    Runs one job per connection and streams its logs and progress back to the client.
+
+    Jobs are run one at a time, so that they don't compete for the CPU and memory.
+    """
+
+    def handle(self) -> None:
+        writer = MessageWriter(self.wfile)
+        message = next(read_messages(self.rfile), None)
+        if message is None or message.get("type") != "job":
+            writer.send({"type": "error", "message": "Expected a job message."})
+            return
+
+        with self.server.job_lock:
+            self.run_job(message["args"], writer)
+
+    def run_job(self, args: dict, writer: MessageWriter) -> None:
+        handler = ForwardingHandler(writer)
+        logging.getLogger().addHandler(handler)
+        try:
+            if args.get("workers", 1) > 1:
+                logger.warning("--workers is not supported by the server, using a single worker.")
+            args["workers"] = 1
+
+            args["video"] = [file_name for path_to_process in args["video"]
+                             for file_name in collect_files(path_to_process)]
+            writer.send({"type": "start", "files": len(args["video"])})
+            args["on_file_done"] = lambda file_name: writer.send(
+                {"type": "progress", "file": file_name})
+            process(args, self.server.models)
+            writer.send({"type": "done"})
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            logger.exception("Job failed.")
+            writer.send({"type": "error", "message": str(exc) or type(exc).__name__})
+        finally:
+            logging.getLogger().removeHandler(handler)
+
+
+class JobServerMixin:
+    daemon_threads = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.job_lock = threading.Lock()
+        self.models = ModelStore()
+
+
+if hasattr(socketserver, "ThreadingUnixStreamServer"):
+    class UnixJobServer(JobServerMixin, socketserver.ThreadingUnixStreamServer):
+        pass
+else:
+    UnixJobServer = None
+
+
+class TCPJobServer(JobServerMixin, socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+
+
+def make_server(address: str) -> socketserver.BaseServer:
+    family, socket_address = parse_address(address)
+    if family != socket.AF_UNIX:
+        return TCPJobServer(socket_address, JobHandler)
+
+    if os.path.exists(socket_address):
+        os.remove(socket_address)
+    server = UnixJobServer(socket_address, JobHandler)
+    os.chmod(socket_address, 0o600)
+    return server
+
+
+def main():
+    """
+    Entry point for the server, which keeps models loaded between jobs.
+
+    Jobs are sent with `faster_auto_subtitle --server [ADDRESS] ...`.
+    """
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--address", type=str, default=DEFAULT_ADDRESS,
+                        help="Unix socket path or host:port to listen on")
+    args = parser.parse_args()
+
+    logging.basicConfig(encoding='utf-8', level=logging.INFO)
+    server = make_server(args.address)
+    logger.info("Listening on %s", args.address)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        family, socket_address = parse_address(args.address)
+        if family == socket.AF_UNIX and os.path.exists(socket_address):
+            os.remove(socket_address)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 from typing import Optional
 from copy import deepcopy
 from faster_whisper.transcribe import Segment
+from ..utils.translation_memory import TranslationMemory, normalize
 try:
     from deep_translator import GoogleTranslator, MyMemoryTranslator, DeeplTranslator, QcriTranslator, LingueeTranslator, PonsTranslator, YandexTranslator, MicrosoftTranslator, PapagoTranslator, LibreTranslator, BaiduTranslator  # type: ignore
 except ImportError:
@@ -22,27 +23,47 @@ TRANSLATOR_MAP = {
 }
 
 class DeepTranslatorWrapper:
-    def __init__(self, mode: str = 'google', **kwargs):
+    backend = 'deep-translator'
+
+    def __init__(self, mode: str = 'google', memory: Optional[TranslationMemory] = None, **kwargs):
         if mode not in TRANSLATOR_MAP or TRANSLATOR_MAP[mode] is None:
             raise ValueError(f"Unknown or unavailable deep-translator mode: {mode}")
         self.mode = mode
         self.translator_class = TRANSLATOR_MAP[mode]
         self.kwargs = kwargs
         self.translator = None
+        self.memory = memory
 
     def translate_segments(self, segments: list[Segment], source_lang: str, target_lang: str) -> Optional[list[Segment]]:
         if self.translator_class is None or not callable(self.translator_class):
             raise ImportError("deep-translator is not installed or the selected mode is unavailable.")
             
         source_text = [segment.text for segment in segments]
-        # Instantiate translator
-        translator = self.translator_class(source=source_lang, target=target_lang, **self.kwargs)
-
-        # Use batch translation if available
-        if hasattr(translator, 'translate_batch'):
-            translated_text = translator.translate_batch(source_text)
-        else:
-            translated_text = [translator.translate(text) for text in source_text]
+        remembered = {}
+        if self.memory is not None:
+            remembered = self.memory.lookup(self.backend, self.mode, source_lang, target_lang, source_text)
+        normalized = [normalize(text) for text in source_text]
+        # Repeated lines are translated once
+        pending = [text for text in dict.fromkeys(normalized) if text not in remembered]
+
+        translated_pending = []
+        if len(pending) > 0:
+            # Instantiate translator
+            translator = self.translator_class(source=source_lang, target=target_lang, **self.kwargs)
+
+            # Use batch translation if available
+            if hasattr(translator, 'translate_batch'):
+                translated_pending = translator.translate_batch(pending)
+            else:
+                translated_pending = [translator.translate(text) for text in pending]
+
+            if self.memory is not None:
+                self.memory.store(self.backend, self.mode, source_lang, target_lang,
+                                  zip(pending, translated_pending))
+
+        translations = dict(zip(pending, translated_pending))
+        translations.update(remembered)
+        translated_text = [translations[text] for text in normalized]
 
         translated_segments = []
         for segment, translation in zip(segments, translated_text):
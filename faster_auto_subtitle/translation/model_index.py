@@ -0,0 +1,200 @@
+import os
+import json
+import time
+import logging
+import argparse
+from typing import Iterable, Optional
+from .languages import to_alpha2_languages
+
+logger = logging.getLogger(__name__)
+
+NLP_ROOT = 'Helsinki-NLP'
+DEFAULT_INDEX_PATH = os.path.join(os.path.expanduser("~"), ".cache", "faster_auto_subtitle",
+                                  "opus-mt-index.json")
+# Seconds after which the index is fetched from the Hugging Face Hub again
+DEFAULT_TTL = 7 * 24 * 60 * 60
+# Seconds to wait after a failed fetch before trying the Hub again
+RETRY_INTERVAL = 60 * 60
+
+RESTRICTED_PREFIXES = [f'{NLP_ROOT}/opus-mt-tc', f'{NLP_ROOT}/opus-mt-synthetic', f'{NLP_ROOT}/opus-mt_tiny']
+
+
+class DownloadableModel:
+    def __init__(self, name: str):
+        self.name = name
+        source_languages, target_languages = self.parse_languages(name)
+        self.source_languages = source_languages
+        self.target_languages = target_languages
+        self.multilanguage = len(self.target_languages) > 1
+        self.language_count = len(
+            self.source_languages) + len(self.target_languages)
+
+    @staticmethod
+    def parse_languages(name: str) -> tuple[set, set]:
+        parts = name.split('-')
+        if len(parts) != 5:
+            return set(), set()
+
+        src, tgt = parts[3], parts[4]
+        return to_alpha2_languages(src.split('_')), to_alpha2_languages(tgt.split('_'))
+
+
+def make_translation_key(source_lang: str, target_lang: str) -> str:
+    return f'{source_lang}-{target_lang}'
+
+
+def usable_model(model_id: str) -> bool:
+    if not model_id.startswith(f'{NLP_ROOT}/opus-mt') or \
+            any(model_id.startswith(prefix) for prefix in RESTRICTED_PREFIXES):
+        return False
+    suffix = model_id.split("/")[1]
+    return suffix == suffix.lower()
+
+
+def fetch_model_names() -> list[str]:
+    logger.info('Loading a list of available language models from OPUS-MT')
+    from huggingface_hub import list_models # pylint: disable=C0415
+    model_list = list_models(author=NLP_ROOT, search='opus-mt', filter=['marian'], sort='last_modified')
+    return [model.modelId for model in model_list if usable_model(model.modelId)]
+
+
+def scan_local_model_names() -> list[str]:
+    """
+    Returns the Opus-MT models already downloaded to the local Hugging Face cache.
+    """
+    from huggingface_hub.constants import HF_HUB_CACHE # pylint: disable=C0415
+    try:
+        entries = os.listdir(HF_HUB_CACHE)
+    except OSError:
+        return []
+
+    names = []
+    for entry in entries:
+        if entry.startswith(f'models--{NLP_ROOT}--opus-mt'):
+            name = entry[len('models--'):].replace('--', '/', 1)
+            if usable_model(name):
+                names.append(name)
+    return sorted(names)
+
+
+def build_index(model_names: Iterable[str]) -> dict[str, str]:
+    """
+    Maps every language pair to the model covering it with the fewest languages.
+    """
+    best: dict[str, DownloadableModel] = {}
+    for model in map(DownloadableModel, model_names):
+        for src in model.source_languages:
+            for tgt in model.target_languages:
+                key = make_translation_key(src, tgt)
+                if key not in best or best[key].language_count > model.language_count:
+                    best[key] = model
+    return {key: model.name for key, model in best.items()}
+
+
+def load_index(path: str) -> Optional[dict]:
+    try:
+        with open(path, "r", encoding="utf-8") as index_file:
+            return json.load(index_file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as exc:
+        logger.warning("Unable to read Opus-MT model index %s: %s", path, exc)
+        return None
+
+
+def save_index(path: str, models: dict[str, str], created: float, checked: float) -> None:
+    """
+    `created` is when the models were fetched from the Hub, `checked` when that was last tried.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as index_file:
+        json.dump({"created": created, "checked": checked, "models": models}, index_file,
+                  indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def refresh_index(path: str = DEFAULT_INDEX_PATH) -> dict[str, str]:
+    """
+    Fetches the index from the Hugging Face Hub and stores it, raising if either fails.
+    """
+    models = build_index(fetch_model_names())
+    now = time.time()
+    save_index(path, models, now, now)
+    return models
+
+
+def offline() -> bool:
+    from huggingface_hub.constants import HF_HUB_OFFLINE # pylint: disable=C0415
+    return bool(HF_HUB_OFFLINE)
+
+
+def model_index(path: str = DEFAULT_INDEX_PATH, ttl: float = DEFAULT_TTL) -> dict[str, str]:
+    """
+    Returns the language pair to model name index.
+
+    The index stored in `path` is used while it is younger than `ttl` seconds. Otherwise it is
+    fetched from the Hugging Face Hub and stored again. Without network access (or with
+    HF_HUB_OFFLINE set), an outdated index is still used, and without any stored index the
+    models in the local Hugging Face cache are indexed. After a failed fetch, the Hub is not
+    tried again for `RETRY_INTERVAL` seconds.
+    """
+    stored = load_index(path)
+    now = time.time()
+    if stored is not None and (now - stored.get("created", 0) < ttl or
+                               now - stored.get("checked", 0) < RETRY_INTERVAL):
+        return stored["models"]
+
+    if not offline():
+        try:
+            return refresh_index(path)
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            logger.warning("Unable to fetch and store the list of Opus-MT models: %s", exc)
+
+    if stored is not None:
+        logger.info("Using the Opus-MT model index stored in %s.", path)
+        models = stored["models"]
+        created = stored.get("created", 0)
+    else:
+        logger.info("Indexing the Opus-MT models in the local Hugging Face cache.")
+        models = build_index(scan_local_model_names())
+        created = 0
+
+    if not offline():
+        try:
+            save_index(path, models, created, now)
+        except OSError as exc:
+            logger.warning("Unable to store Opus-MT model index in %s: %s", path, exc)
+    return models
+
+
+def main(argv: Optional[list[str]] = None):
+    """
+    Entry point for `faster_auto_subtitle translation_index`.
+
+    Fetches the list of Opus-MT models and stores the language pair index, so that later
+    runs don't query the Hugging Face Hub.
+    """
+    parser = argparse.ArgumentParser(
+        prog="faster_auto_subtitle translation_index",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--refresh", action="store_true",
+                        help="fetch the index again even if the stored one is up to date, \
+                              fails if it can't be fetched and stored")
+    parser.add_argument("--index", type=str, default=DEFAULT_INDEX_PATH,
+                        help="file the index is stored in")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(encoding='utf-8', level=logging.INFO)
+
+    if args.refresh:
+        try:
+            models = refresh_index(args.index)
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            logger.error("Unable to refresh the Opus-MT model index: %s", exc)
+            return 1
+    else:
+        models = model_index(args.index)
+
+    logger.info("%d language pairs covered by %d models.", len(models), len(set(models.values())))
+    return 0 if len(models) > 0 else 1
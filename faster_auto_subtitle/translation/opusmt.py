@@ -1,3 +1,4 @@
+import sys
 import time
 import logging
 import re
@@ -5,31 +6,42 @@ from copy import deepcopy
 from typing import List, Optional, Union
 import numpy as np
 import tqdm
-import nltk
-import torch
-from huggingface_hub import list_models
-from transformers import MarianMTModel, MarianTokenizer
 from faster_whisper.transcribe import Segment
-from .languages import to_alpha2_languages, to_alpha3_language
+from .languages import to_alpha3_language
+from .model_index import DEFAULT_INDEX_PATH, DownloadableModel, make_translation_key, model_index
+from ..utils.translation_memory import TranslationMemory, normalize
 
 logger = logging.getLogger(__name__)
 
-NLP_ROOT = 'Helsinki-NLP'
+# Padded tokens per batch: number of sentences times the length of the longest one
+DEFAULT_MAX_TOKENS = 4096
 
 
 class OpusMTWrapper:
-    def __init__(self, device=None):
+    backend = 'opusmt'
+
+    def __init__(self, device=None, translator: Optional['OpusMT'] = None,
+                 max_tokens: int = DEFAULT_MAX_TOKENS, memory: Optional[TranslationMemory] = None):
         """
         Easy-to-use, state-of-the-art machine translation
         :param model_name:  Model name (see Readme for available models)
         :param translator: Translator object. Set to None, to automatically load the model via the model name.
         :param device: CPU / GPU device for PyTorch
+        :param max_tokens: Budget of padded tokens per batch, lowered when the GPU runs out of memory
+        :param memory: Translation memory consulted before translating a sentence
         """
         if device is None or device == 'auto':
-            device = 'cuda' if torch.cuda.is_available() else 'cpu'
+            device = self.default_device()
 
         self.device = device
-        self.translator = OpusMT()
+        self.max_tokens = max_tokens
+        self.memory = memory
+        self.translator = translator if translator is not None else OpusMT()
+
+    @staticmethod
+    def default_device() -> str:
+        import torch # pylint: disable=C0415
+        return 'cuda' if torch.cuda.is_available() else 'cpu'
 
     def translate_segments(self, segments: list[Segment], source_lang: str, target_lang: str) -> Optional[list[Segment]]:
         source_text = [segment.text for segment in segments]
@@ -46,7 +58,7 @@ class OpusMTWrapper:
         return translated_segments
 
     def translate(self, documents: Union[str, List[str]], target_lang: str, source_lang: str,
-                  show_progress_bar: bool = False, beam_size: int = 5, batch_size: int = 16,
+                  show_progress_bar: bool = False, beam_size: int = 5, batch_size: int = 64,
                   perform_sentence_splitting: bool = True, paragraph_split: str = "\n", sentence_splitter=None,
                   **kwargs):
         """
@@ -56,7 +68,7 @@ class OpusMTWrapper:
         :param source_lang: Source language for all documents. If None, determines the source languages automatically.
         :param show_progress_bar: If true, plot a progress bar on the progress for the translation
         :param beam_size: Size for beam search
-        :param batch_size: Number of sentences to translate at the same time
+        :param batch_size: Maximum number of sentences to translate at the same time
         :param perform_sentence_splitting: Longer documents are broken down sentences, which are translated individually
         :param paragraph_split: Split symbol for paragraphs. No sentences can go across the paragraph_split symbol.
         :param sentence_splitter: Method used to split sentences. If None, uses the default self.sentence_splitting method
@@ -131,16 +143,21 @@ class OpusMTWrapper:
         return translated_doc
 
     def translate_sentences(self, sentences: Union[str, List[str]], target_lang: str, source_lang: str,
-                            show_progress_bar: bool = False, beam_size: int = 5, batch_size: int = 32, **kwargs):
+                            show_progress_bar: bool = False, beam_size: int = 5, batch_size: int = 64, **kwargs):
         """
         This method translates individual sentences.
 
+        Every distinct sentence is translated once, sentences found in the translation memory are not
+        translated at all. The others are sorted by their number of tokens and batched so that a batch, padded to its
+        longest sentence, stays within `self.max_tokens`: short lines are translated in large batches
+        and long ones in small batches.
+
         :param sentences: A single sentence or a list of sentences to be translated
         :param source_lang: Source language for all sentences. If none, determines automatically the source language
         :param target_lang: Target language for the translation
         :param show_progress_bar: Show a progress bar
         :param beam_size: Size for beam search
-        :param batch_size: Mini batch size
+        :param batch_size: Maximum number of sentences in a batch
         :return: List of translated sentences
         """
 
@@ -152,27 +169,82 @@ class OpusMTWrapper:
             sentences = [sentences]
             is_single_sentence = True
 
+        model_name = self.translator.model_name(source_lang, target_lang)
+        remembered = {}
+        if self.memory is not None and model_name is not None:
+            remembered = self.memory.lookup(self.backend, model_name, source_lang, target_lang, sentences)
+
+        # Repeated sentences ("Yeah.", refrains) are translated once and fanned out afterwards
+        normalized = [normalize(sen) for sen in sentences]
+        unique = list(dict.fromkeys(normalized))
+        if len(unique) < len(sentences):
+            logger.info("Translating %d unique of %d sentences.", len(unique), len(sentences))
+        pending = [sen for sen in unique if sen not in remembered]
+        translated = dict(zip(pending, self._translate_batched(pending, target_lang, source_lang, show_progress_bar,
+                                                               beam_size, batch_size, **kwargs)))
+        if self.memory is not None and model_name is not None:
+            self.memory.store(self.backend, model_name, source_lang, target_lang, translated.items())
+
+        translated.update(remembered)
+        output = [translated[sen] for sen in normalized]
+
+        if is_single_sentence:
+            output = output[0]
+
+        return output
+
+    def _translate_batched(self, sentences: List[str], target_lang: str, source_lang: str,
+                           show_progress_bar: bool, beam_size: int, batch_size: int, **kwargs) -> List[str]:
+        if len(sentences) == 0:
+            return []
+
         output = []
 
+        token_counts = self.translator.count_tokens(sentences, source_lang, target_lang)
+        if token_counts is None:
+            # Rough estimate when no tokenizer is available
+            token_counts = [len(sen) // 4 + 1 for sen in sentences]
+
         #Sort by length to speed up processing
-        length_sorted_idx = np.argsort([-len(sen) for sen in sentences])
+        length_sorted_idx = np.argsort([-count for count in token_counts], kind='stable')
         sentences_sorted = [sentences[idx] for idx in length_sorted_idx]
-
-        iterator = range(0, len(sentences_sorted), batch_size)
-        if show_progress_bar:
-            scale = min(batch_size, len(sentences))
-            iterator = tqdm.tqdm(iterator, total=len(sentences)/scale, unit_scale=scale, smoothing=0)
-
-        for start_idx in iterator:
-            output.extend(self.translator.translate_sentences(sentences_sorted[start_idx:start_idx+batch_size], source_lang=source_lang, target_lang=target_lang, beam_size=beam_size, device=self.device, **kwargs))
+        counts_sorted = [token_counts[idx] for idx in length_sorted_idx]
+
+        pbar = tqdm.tqdm(total=len(sentences), smoothing=0, disable=not show_progress_bar)
+        with pbar:
+            start_idx = 0
+            while start_idx < len(sentences_sorted):
+                end_idx = self._batch_end(counts_sorted, start_idx, batch_size)
+                try:
+                    translated = self.translator.translate_sentences(sentences_sorted[start_idx:end_idx], source_lang=source_lang, target_lang=target_lang, beam_size=beam_size, device=self.device, **kwargs)
+                except RuntimeError as exc:
+                    if end_idx - start_idx == 1 or not self._is_out_of_memory(exc):
+                        raise
+                    self.translator.free_memory()
+                    self.max_tokens = max((end_idx - start_idx) * counts_sorted[start_idx] // 2, 1)
+                    logger.warning("Out of memory translating %d sentences, lowering the batch budget to %d tokens.",
+                                   end_idx - start_idx, self.max_tokens)
+                    continue
+
+                output.extend(translated)
+                pbar.update(end_idx - start_idx)
+                start_idx = end_idx
 
         #Restore original sorting of sentences
-        output = [output[idx] for idx in np.argsort(length_sorted_idx)]
+        return [output[idx] for idx in np.argsort(length_sorted_idx)]
 
-        if is_single_sentence:
-            output = output[0]
+    def _batch_end(self, counts_sorted: List[int], start_idx: int, batch_size: int) -> int:
+        """
+        Returns the end of the batch starting at `start_idx`. Counts are sorted in descending order,
+        so the first sentence is the one the batch is padded to.
+        """
+        longest = max(counts_sorted[start_idx], 1)
+        size = max(min(batch_size, self.max_tokens // longest), 1)
+        return min(start_idx + size, len(counts_sorted))
 
-        return output
+    def _is_out_of_memory(self, exc: RuntimeError) -> bool:
+        # Both torch.cuda.OutOfMemoryError and CTranslate2 CUDA errors are RuntimeErrors
+        return self.device != 'cpu' and 'out of memory' in str(exc).lower()
 
     def sentence_splitting(self, text: str, lang: str):
         if lang == 'th':
@@ -181,6 +253,7 @@ class OpusMTWrapper:
         elif lang in ['ar', 'jp', 'ko', 'zh']:
             sentences = list(re.findall('[^!?。.]+[!?。.]*', text, flags=re.U))
         else:
+            import nltk # pylint: disable=C0415
             try:
                 nltk.data.find('tokenizers/punkt_tab')
             except LookupError:
@@ -191,9 +264,10 @@ class OpusMTWrapper:
         return sentences
 
 class OpusMT:
-    def __init__(self, max_loaded_models: int = 10):
+    def __init__(self, max_loaded_models: int = 10, index_path: str = DEFAULT_INDEX_PATH):
         self.models: dict = {}
         self.max_loaded_models: int = max_loaded_models
+        self.index_path = index_path
         self.max_length: Optional[int] = None
         self.available_models: Optional[dict[str, DownloadableModel]] = None
         self.prepared_translations: dict = {}
@@ -204,9 +278,7 @@ class OpusMT:
             return self.models[model_name]['tokenizer'], self.models[model_name]['model']
 
         logger.info("Load model: %s", model_name)
-        tokenizer = MarianTokenizer.from_pretrained(model_name)
-        model = MarianMTModel.from_pretrained(model_name)
-        model.eval()
+        tokenizer, model = self.create_model(model_name)
 
         if len(self.models) >= self.max_loaded_models:
             oldest_time = time.time()
@@ -221,34 +293,55 @@ class OpusMT:
             'tokenizer': tokenizer, 'model': model, 'last_loaded': time.time()}
         return tokenizer, model
 
+    def create_model(self, model_name: str) -> tuple:
+        from transformers import MarianMTModel, MarianTokenizer # pylint: disable=C0415
+        tokenizer = MarianTokenizer.from_pretrained(model_name)
+        model = MarianMTModel.from_pretrained(model_name)
+        model.eval()
+        return tokenizer, model
+
     def load_available_models(self) -> None:
         if self.available_models is not None:
             return
 
-        logger.info('Loading a list of available language models from OPUS-MT')
-        model_list = list_models(author=NLP_ROOT, search='opus-mt', filter=['marian'], sort='last_modified')
+        index = model_index(self.index_path)
+        models = {name: DownloadableModel(name) for name in set(index.values())}
+        self.available_models = {key: models[name] for key, name in index.items()}
 
-        restricted_prefixes = [f'{NLP_ROOT}/opus-mt-tc', f'{NLP_ROOT}/opus-mt-synthetic', f'{NLP_ROOT}/opus-mt_tiny']
+    def count_tokens(self, sentences: List[str], source_lang: str, target_lang: str) -> Optional[List[int]]:
+        """
+        Returns the number of tokens of each sentence for the first model of the translation,
+        or None if the translation was not prepared.
+        """
+        translations = self.prepared_translations.get(self.make_translation_key(source_lang, target_lang))
+        if not translations or self.available_models is None:
+            return None
 
-        suffix = [x.modelId.split("/")[1] for x in model_list
-                  if x.modelId.startswith(f'{NLP_ROOT}/opus-mt') and not any(x.modelId.startswith(r) for r in restricted_prefixes)]
+        model_data = self.available_models[translations[0][2]]
+        tokenizer, _ = self.load_model(model_data.name)
+        input_ids = tokenizer(sentences, truncation=True, max_length=self.max_length)["input_ids"]
+        # Multilanguage models get a target language token prepended
+        return [len(ids) + int(model_data.multilanguage) for ids in input_ids]
 
-        models = [DownloadableModel(f"{NLP_ROOT}/{s}")
-                  for s in suffix if s == s.lower()]
+    def model_name(self, source_lang: str, target_lang: str) -> Optional[str]:
+        """
+        Returns the names of the models used for the translation, joined by "+" when it goes
+        through English, or None if the translation was not prepared.
+        """
+        translations = self.prepared_translations.get(self.make_translation_key(source_lang, target_lang))
+        if not translations or self.available_models is None:
+            return None
+        return "+".join(self.available_models[key].name for _, _, key in translations)
 
-        self.available_models = {}
-        for model in models:
-            for src in model.source_languages:
-                for tgt in model.target_languages:
-                    key = self.make_translation_key(src, tgt)
-                    if key not in self.available_models:
-                        self.available_models[key] = model
-                    elif self.available_models[key].language_count > model.language_count:
-                        self.available_models[key] = model
+    def free_memory(self) -> None:
+        if 'torch' in sys.modules:
+            import torch # pylint: disable=C0415
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
 
     @staticmethod
     def make_translation_key(source_lang: str, target_lang: str) -> str:
-        return f'{source_lang}-{target_lang}'
+        return make_translation_key(source_lang, target_lang)
 
     def prepare_translation(self, source_lang: str, target_lang: str) -> bool:
         self.load_available_models()
@@ -308,7 +401,6 @@ class OpusMT:
             model_data = self.available_models[key]
             model_name = model_data.name
             tokenizer, model = self.load_model(model_name)
-            model.to(device)
 
             # MultiLanguage model requires prepending each line with target language
             if model_data.multilanguage:
@@ -317,36 +409,23 @@ class OpusMT:
                     x for x in tokenizer.supported_language_codes if alpha3 in x)
                 intermediate = [f'{prefix} {x}' for x in intermediate]
 
-            inputs = tokenizer(intermediate, truncation=True, padding=True,
-                               max_length=self.max_length, return_tensors="pt")
-
-            for token in inputs:
-                inputs[token] = inputs[token].to(device)
-
-            with torch.no_grad():
-                translated = model.generate(
-                    **inputs, num_beams=beam_size, **kwargs)
-                intermediate = [tokenizer.decode(
-                    t, skip_special_tokens=True) for t in translated]
+            intermediate = self.generate(tokenizer, model, intermediate, device, beam_size, **kwargs)
 
         return intermediate
 
+    def generate(self, tokenizer, model, sentences: List[str], device: str, beam_size: int,
+                 **kwargs) -> List[str]:
+        import torch # pylint: disable=C0415
 
-class DownloadableModel:
-    def __init__(self, name: str):
-        self.name = name
-        source_languages, target_languages = self.parse_languages(name)
-        self.source_languages = source_languages
-        self.target_languages = target_languages
-        self.multilanguage = len(self.target_languages) > 1
-        self.language_count = len(
-            self.source_languages) + len(self.target_languages)
+        model.to(device)
+        inputs = tokenizer(sentences, truncation=True, padding=True,
+                           max_length=self.max_length, return_tensors="pt")
 
-    @staticmethod
-    def parse_languages(name: str) -> tuple[set, set]:
-        parts = name.split('-')
-        if len(parts) != 5:
-            return set(), set()
+        for token in inputs:
+            inputs[token] = inputs[token].to(device)
 
-        src, tgt = parts[3], parts[4]
-        return to_alpha2_languages(src.split('_')), to_alpha2_languages(tgt.split('_'))
+        with torch.no_grad():
+            translated = model.generate(
+                **inputs, num_beams=beam_size, **kwargs)
+            return [tokenizer.decode(
+                t, skip_special_tokens=True) for t in translated]
@@ -0,0 +1,79 @@
+import os
+import shutil
+import logging
+from typing import List, Optional
+from .opusmt import OpusMT, OpusMTWrapper
+from ..utils.translation_memory import TranslationMemory
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "faster_auto_subtitle",
+                                 "opus-mt-ct2")
+
+
+class OpusMTCT2Wrapper(OpusMTWrapper):
+    backend = 'opusmt-ct2'
+
+    def __init__(self, device=None, cache_dir: Optional[str] = None, compute_type: str = 'auto',
+                 memory: Optional[TranslationMemory] = None):
+        """
+        Opus-MT translation running the Marian models with CTranslate2
+        :param device: CPU / GPU device for CTranslate2
+        :param cache_dir: Directory the converted models are stored in
+        :param compute_type: CTranslate2 compute type, see https://opennmt.net/CTranslate2/quantization.html
+        :param memory: Translation memory consulted before translating a sentence
+        """
+        super().__init__(device, OpusMTCT2(cache_dir or DEFAULT_CACHE_DIR, compute_type), memory=memory)
+        self.translator.device = self.device
+
+    @staticmethod
+    def default_device() -> str:
+        import ctranslate2 # pylint: disable=C0415
+        return 'cuda' if ctranslate2.get_cuda_device_count() > 0 else 'cpu'
+
+
+class OpusMTCT2(OpusMT):
+    """
+    Opus-MT models converted once to the CTranslate2 format and kept in `cache_dir`.
+    """
+
+    def __init__(self, cache_dir: str, compute_type: str = 'auto', max_loaded_models: int = 10):
+        super().__init__(max_loaded_models)
+        self.cache_dir = cache_dir
+        self.compute_type = compute_type
+        self.device = 'cpu'
+
+    def converted_model_path(self, model_name: str) -> str:
+        path = os.path.join(self.cache_dir, model_name.replace('/', '--'))
+        if os.path.isdir(path):
+            return path
+
+        import ctranslate2 # pylint: disable=C0415
+        logger.info("Converting %s to CTranslate2 format...", model_name)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        ctranslate2.converters.TransformersConverter(model_name).convert(tmp_path, force=True)
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            # Converted by another process in the meantime
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        return path
+
+    def create_model(self, model_name: str) -> tuple:
+        import ctranslate2 # pylint: disable=C0415
+        from transformers import MarianTokenizer # pylint: disable=C0415
+        tokenizer = MarianTokenizer.from_pretrained(model_name)
+        model = ctranslate2.Translator(self.converted_model_path(model_name),
+                                       device=self.device,
+                                       compute_type=self.compute_type)
+        return tokenizer, model
+
+    def generate(self, tokenizer, model, sentences: List[str], device: str, beam_size: int,
+                 **kwargs) -> List[str]:
+        input_ids = tokenizer(sentences, truncation=True, max_length=self.max_length)["input_ids"]
+        tokens = [tokenizer.convert_ids_to_tokens(ids) for ids in input_ids]
+        results = model.translate_batch(tokens, beam_size=beam_size, **kwargs)
+        return [tokenizer.decode(tokenizer.convert_tokens_to_ids(result.hypotheses[0]),
+                                 skip_special_tokens=True)
+                for result in results]
@@ -0,0 +1,82 @@
+import os
+import json
+import logging
+import dataclasses
+from typing import Iterable, Iterator, Optional
+from faster_whisper.transcribe import Segment
+from .transcript_cache import to_segment
+
+logger = logging.getLogger(__name__)
+
+
+class CheckpointJournal:
+    """
+    Append-only journal of the segments of an unfinished transcription.
+
+    The first line holds the detected language, every following line one segment as JSON.
+    Each segment is flushed and fsynced as soon as it is produced, so a transcription that
+    was interrupted can be resumed after the last recorded segment. The journal is removed
+    once the transcription completes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> tuple[list[Segment], Optional[str]]:
+        """
+        Returns the recorded segments and language, or ([], None) if there is no journal.
+
+        A partially written last line is cut off, so that new segments are appended cleanly.
+        """
+        segments: list[Segment] = []
+        language = None
+        valid_size = 0
+        try:
+            with open(self.path, "rb") as journal:
+                for line in journal:
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break
+                    if language is None:
+                        language = entry["language"]
+                    else:
+                        segments.append(to_segment(entry))
+                    valid_size += len(line)
+        except FileNotFoundError:
+            return [], None
+
+        if language is None:
+            valid_size = 0
+        if valid_size < os.path.getsize(self.path):
+            with open(self.path, "r+b") as journal:
+                journal.truncate(valid_size)
+
+        return segments, language
+
+    def record(self, language: str, recorded: list[Segment],
+               segments: Iterable[Segment]) -> Iterator[Segment]:
+        """
+        Yields the already recorded segments followed by the new ones,
+        appending every new segment to the journal before it is yielded.
+        """
+        yield from recorded
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as journal:
+            if journal.tell() == 0:
+                self.append(journal, {"language": language})
+            for segment_id, segment in enumerate(segments, start=len(recorded) + 1):
+                segment = dataclasses.replace(segment, id=segment_id)
+                self.append(journal, dataclasses.asdict(segment))
+                yield segment
+
+        os.remove(self.path)
+
+    @staticmethod
+    def append(journal, entry: dict) -> None:
+        journal.write(json.dumps(entry) + "\n")
+        journal.flush()
+        os.fsync(journal.fileno())
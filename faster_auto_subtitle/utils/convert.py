@@ -1,5 +1,5 @@
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Union
 
 
 def str2bool(string: str) -> bool:
@@ -13,6 +13,18 @@ def str2bool(string: str) -> bool:
         f"Expected one of {set(str2val.keys())}, got {string}")
 
 
+def str2channels(string: str) -> Union[str, list[int]]:
+    if string == 'all':
+        return string
+
+    channels = string.split(',')
+    if not all(x.strip().isdigit() for x in channels):
+        raise ValueError(
+            f"Expected 'all' or comma-separated audio channel indexes (e.g. 0,2), got {string}")
+
+    return [int(x) for x in channels]
+
+
 def str2timeinterval(string: str) -> Optional[list[int]]:
     if string is None:
         return None
@@ -76,14 +88,9 @@ def format_timestamp(seconds: float, always_include_hours: bool = False) -> str:
     assert seconds >= 0, "non-negative timestamp expected"
     milliseconds = round(seconds * 1000.0)
 
-    hours = milliseconds // 3_600_000
-    milliseconds -= hours * 3_600_000
-
-    minutes = milliseconds // 60_000
-    milliseconds -= minutes * 60_000
-
-    seconds = milliseconds // 1_000
-    milliseconds -= seconds * 1_000
+    hours, milliseconds = divmod(milliseconds, 3_600_000)
+    minutes, milliseconds = divmod(milliseconds, 60_000)
+    seconds, milliseconds = divmod(milliseconds, 1_000)
 
     hours_marker = f"{hours:02d}:" if always_include_hours or hours > 0 else ""
     return f"{hours_marker}{minutes:02d}:{seconds:02d},{milliseconds:03d}"
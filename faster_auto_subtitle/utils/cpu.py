@@ -0,0 +1,71 @@
+import os
+import glob
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def available_cpus() -> list[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def parse_cpu_list(cpu_list: str) -> list[int]:
+    cpus = []
+    for part in cpu_list.strip().split(','):
+        if part == '':
+            continue
+        if '-' in part:
+            first, last = part.split('-')
+            cpus.extend(range(int(first), int(last) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+def numa_nodes() -> list[list[int]]:
+    """
+    Returns available CPUs grouped by NUMA node, or a single group if the topology is unknown.
+    """
+    cpus = available_cpus()
+    nodes = []
+    for path in sorted(glob.glob('/sys/devices/system/node/node[0-9]*/cpulist')):
+        try:
+            with open(path, "r", encoding="utf-8") as cpu_list:
+                node_cpus = [cpu for cpu in parse_cpu_list(cpu_list.read()) if cpu in cpus]
+        except (OSError, ValueError):
+            return [cpus]
+        if len(node_cpus) > 0:
+            nodes.append(node_cpus)
+
+    return nodes or [cpus]
+
+
+def split_cpus(worker_count: int) -> list[list[int]]:
+    """
+    Splits available CPUs into `worker_count` disjoint sets.
+
+    Workers are spread over NUMA nodes round-robin, so that every set stays within one node.
+    If there are more workers on a node than CPUs, the CPUs are shared.
+    """
+    nodes = numa_nodes()
+    node_workers: list[list[int]] = [[] for _ in nodes]
+    for worker in range(worker_count):
+        node_workers[worker % len(nodes)].append(worker)
+
+    cpu_sets: list[list[int]] = [[] for _ in range(worker_count)]
+    for node_cpus, workers in zip(nodes, node_workers):
+        for index, worker in enumerate(workers):
+            start = index * len(node_cpus) // len(workers)
+            end = (index + 1) * len(node_cpus) // len(workers)
+            cpu_sets[worker] = node_cpus[start:end] or [node_cpus[index % len(node_cpus)]]
+
+    return cpu_sets
+
+
+def pin_to_cpus(cpus: list[int]) -> None:
+    if not hasattr(os, "sched_setaffinity"):
+        logger.warning("CPU pinning is not supported on this platform.")
+        return
+    os.sched_setaffinity(0, cpus)
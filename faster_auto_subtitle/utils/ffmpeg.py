@@ -1,72 +1,160 @@
 import os
-import tempfile
 import logging
-from typing import Optional
+import subprocess
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Union
 import ffmpeg
-from .tempfile import SubtitlesTempFile
+import numpy as np
+from .tempfile import SubtitlesTempFile, SubtitlesPipe
 from .files import filename
+from .probe import probe, audio_streams, keyframes
 from ..models.subtitles import Subtitles
 
 logger = logging.getLogger(__name__)
 
+SAMPLE_RATE = 16000
+MP4_AUDIO_CODECS = {'aac', 'mp3', 'ac3', 'eac3', 'opus', 'flac', 'alac'}
 
-def get_audio(path: str, audio_channel_index: int, sample_interval: Optional[list] = None) -> str:
-    temp_dir = tempfile.gettempdir()
 
+def get_audio(path: str, audio_channel_index: int,
+              sample_interval: Optional[list] = None) -> np.ndarray:
     file_name = filename(path)
     logger.info("Extracting audio from %s...", file_name)
-    output_path = os.path.join(temp_dir, f"{file_name}.wav")
 
     ffmpeg_input_args = {}
     if sample_interval is not None:
         ffmpeg_input_args['ss'] = str(sample_interval[0])
 
     ffmpeg_output_args = {
+        'format': "s16le",
         'acodec': "pcm_s16le",
         'ac': "1",
-        'ar': "16k",
+        'ar': str(SAMPLE_RATE),
         'map': "0:a:" + str(audio_channel_index)
     }
     if sample_interval is not None:
         ffmpeg_output_args['t'] = str(
             sample_interval[1] - sample_interval[0])
 
-    ffmpeg.input(path, **ffmpeg_input_args).output(
-        output_path,
+    # Raw PCM is streamed through stdout, so no intermediate file is written
+    out, _ = ffmpeg.input(path, **ffmpeg_input_args).output(
+        'pipe:',
         **ffmpeg_output_args
-    ).run(quiet=True, overwrite_output=True)
+    ).run(capture_stdout=True, capture_stderr=True)
+
+    return pcm_to_float(out)
+
+
+def get_audio_tracks(path: str, audio_channel_indices: list[int],
+                     sample_interval: Optional[list] = None) -> list[np.ndarray]:
+    if len(audio_channel_indices) == 1:
+        return [get_audio(path, audio_channel_indices[0], sample_interval)]
+
+    file_name = filename(path)
+    logger.info("Extracting %d audio tracks from %s...", len(audio_channel_indices), file_name)
+
+    ffmpeg_input_args = {}
+    if sample_interval is not None:
+        ffmpeg_input_args['ss'] = str(sample_interval[0])
+
+    if sample_interval is not None:
+        duration = str(sample_interval[1] - sample_interval[0])
+    else:
+        duration = probe(path)['format'].get('duration')
+
+    # Every track is downmixed to mono and padded to the same length, then all of them
+    # are merged into one multichannel stream, so the container is demuxed only once
+    input_stream = ffmpeg.input(path, **ffmpeg_input_args)
+    tracks = []
+    for audio_channel_index in audio_channel_indices:
+        track = input_stream[f'a:{audio_channel_index}'].filter(
+            'aformat', sample_fmts='s16', sample_rates=SAMPLE_RATE, channel_layouts='mono')
+        if duration is not None:
+            track = track.filter('apad', whole_dur=duration)
+        tracks.append(track)
+
+    ffmpeg_output_args = {
+        'format': "s16le",
+        'acodec': "pcm_s16le"
+    }
+    if duration is not None:
+        ffmpeg_output_args['t'] = duration
+
+    out, _ = ffmpeg.filter(tracks, 'amerge', inputs=len(tracks)).output(
+        'pipe:',
+        **ffmpeg_output_args
+    ).run(capture_stdout=True, capture_stderr=True)
+
+    merged = pcm_to_float(out).reshape(-1, len(tracks))
+    return [np.ascontiguousarray(merged[:, i]) for i in range(len(tracks))]
+
+
+def select_audio_channels(path: str, audio_channels: Union[str, list[int]]) -> list[int]:
+    channel_count = len(audio_streams(probe(path)))
+    if audio_channels == 'all':
+        return list(range(channel_count))
+
+    missing = [channel for channel in audio_channels if channel >= channel_count]
+    if len(missing) > 0:
+        logger.warning("File %s has only %d audio channels, ignoring %s.",
+                       filename(path), channel_count, missing)
 
-    return output_path
+    return [channel for channel in audio_channels if channel < channel_count]
+
+
+def open_audio_stream(source: str, audio_channel_index: int) -> subprocess.Popen:
+    """
+    Starts ffmpeg decoding `source` ("-" for stdin, a FIFO or an URL) into 16 kHz mono s16le
+    on its stdout, as the input arrives.
+    """
+    ffmpeg_input_args = {'flags': "low_delay"}
+    global_args = ['-loglevel', 'error']
+    if source == '-':
+        source = 'pipe:'
+    else:
+        # Otherwise ffmpeg reads interactive commands from stdin
+        global_args.append('-nostdin')
+
+    return ffmpeg.input(source, **ffmpeg_input_args).output(
+        'pipe:',
+        format="s16le",
+        acodec="pcm_s16le",
+        ac="1",
+        ar=str(SAMPLE_RATE),
+        map="0:a:" + str(audio_channel_index)
+    ).global_args(*global_args).run_async(pipe_stdout=True)
+
+
+def pcm_to_float(buffer: bytes) -> np.ndarray:
+    return np.frombuffer(buffer, np.int16).astype(np.float32) / 32768.0
 
 
 def file_has_audio(path: str) -> bool:
     try:
-        audio_info = ffmpeg.probe(path, select_streams='a')
-        return 'streams' in audio_info \
-            and audio_info['streams'] is not None \
-            and len(audio_info['streams']) > 0
-    except ffmpeg.Error:
+        return len(audio_streams(probe(path))) > 0
+    except (ffmpeg.Error, OSError):
         return False
 
 
-def preprocess_audio(path: str, audio_channel_index: int, sample_interval: Optional[list]) -> str:
+def preprocess_audio(path: str, audio_channel_index: int,
+                     sample_interval: Optional[list]) -> Union[str, np.ndarray]:
     if sample_interval is not None or audio_channel_index != 0:
         return get_audio(path, audio_channel_index, sample_interval)
 
-    audio_info = ffmpeg.probe(path, select_streams='a')
+    audio_info = probe(path)
     audio_format = audio_info['format']
-    audio_streams = audio_info['streams']
-    if audio_format['format_name'] == 'wav' and \
-            audio_streams is not None and len(audio_streams) == 1:
-        audio_stream = audio_streams[0]
+    streams = audio_streams(audio_info)
+    if audio_format['format_name'] == 'wav' and len(streams) == 1:
+        audio_stream = streams[0]
         if audio_stream['codec_name'] == 'pcm_s16le' and audio_stream['sample_rate'] == '16000':
             return path
 
     return get_audio(path, audio_channel_index)
 
 
-def add_subtitles(path: str, transcribed: Subtitles, translated: Optional[Subtitles],
-                  sample_interval: list, output_args: dict[str, str]) -> None:
+def add_subtitles(path: str, tracks: list[tuple[Subtitles, Optional[Subtitles]]],
+                  sample_interval: list, output_args: dict) -> None:
     file_name = filename(path)
     out_path = os.path.join(output_args["output_dir"], f"{file_name}.mp4")
 
@@ -81,17 +169,54 @@ def add_subtitles(path: str, transcribed: Subtitles, translated: Optional[Subtit
         ffmpeg_output_args['t'] = str(
             sample_interval[1] - sample_interval[0])
 
+    encode_args = {}
+    if output_args.get("video_preset") is not None:
+        encode_args['preset'] = output_args["video_preset"]
+    if output_args.get("ffmpeg_threads"):
+        encode_args['threads'] = str(output_args["ffmpeg_threads"])
+
+    cut_points = None
+    if output_args["subtitle_type"] == 'hard' and output_args.get("burn_segments", 1) > 1:
+        cut_points = find_cut_points(path, sample_interval, output_args["burn_segments"])
+
+    # Burned pieces take about as much space as the input
+    expected_size = os.path.getsize(path) if cut_points is not None else 0
+
     # HACK: On Windows it's impossible to use absolute subtitle file path with ffmpeg,
-    # so we use temp copy instead
+    # so we use relative paths, falling back to temp copy instead
     # see: https://github.com/kkroening/ffmpeg-python/issues/745
-    with SubtitlesTempFile(transcribed) as transcribed_tmp, SubtitlesTempFile(
-            translated) as translated_tmp:
+    with ExitStack() as stack:
+        job_dir = '.'
+        if output_args.get("workspace") is not None:
+            job_dir = stack.enter_context(
+                output_args["workspace"].job_dir(file_name, expected_size))
 
         if output_args["subtitle_type"] == 'hard':
-            hard_subtitles(path, out_path, transcribed_tmp, translated_tmp, ffmpeg_input_args,
-                           ffmpeg_output_args)
+            if len(tracks) > 1:
+                logger.warning("Only subtitles for the first audio track are burned into %s.",
+                               file_name)
+            transcribed, translated = tracks[0]
+            transcribed_tmp = stack.enter_context(SubtitlesTempFile(transcribed, job_dir))
+            translated_tmp = stack.enter_context(SubtitlesTempFile(translated, job_dir))
+            if cut_points is not None:
+                hard_subtitles_segmented(path, out_path, transcribed_tmp, translated_tmp,
+                                         cut_points, job_dir, encode_args)
+            else:
+                hard_subtitles(path, out_path, transcribed_tmp, translated_tmp, ffmpeg_input_args,
+                               dict(ffmpeg_output_args, **encode_args))
         elif output_args["subtitle_type"] == 'soft':
-            soft_subtitles(path, out_path, transcribed_tmp, translated_tmp, ffmpeg_input_args,
+            subtitles_sources = []
+            for subtitles in (subtitles for track in tracks for subtitles in track):
+                if subtitles is None:
+                    continue
+                saved = subtitles.output_path is not None and os.path.isfile(subtitles.output_path)
+                # Pipes can't be passed to a child process on Windows
+                if saved or os.name == 'nt':
+                    subtitles_sources.append(
+                        stack.enter_context(SubtitlesTempFile(subtitles, job_dir)))
+                else:
+                    subtitles_sources.append(stack.enter_context(SubtitlesPipe(subtitles)))
+            soft_subtitles(path, out_path, subtitles_sources, ffmpeg_input_args,
                            ffmpeg_output_args)
 
     logger.info("Saved subtitled video to %s.", os.path.abspath(out_path))
@@ -101,39 +226,141 @@ def hard_subtitles(input_path: str, output_path: str,
                    transcribed: SubtitlesTempFile, translated: SubtitlesTempFile,
                    input_args: dict, output_args: dict) -> None:
     video = ffmpeg.input(input_path, **input_args)
-    audio = video.audio
+    # Like the concat filter used before, only the first audio stream is kept
+    audio = video['a:0']
+
+    intermediate = burn_subtitles(video, transcribed, translated)
+    # Only video goes through the filter graph, audio is copied untouched when possible
+    ffmpeg.output(
+        intermediate, audio, output_path, acodec=audio_codec(input_path, 0), **output_args
+    ).run(quiet=True, overwrite_output=True)
+
 
+def burn_subtitles(video, transcribed: SubtitlesTempFile, translated: SubtitlesTempFile):
     intermediate = video.filter(
         'subtitles', transcribed.tmp_file_path,
         force_style="OutlineColour=&H40000000,BorderStyle=3")
 
-    if translated.tmp_file is not None:
+    if translated.tmp_file_path is not None:
         intermediate = intermediate.filter(
             'subtitles', translated.tmp_file_path,
             force_style="OutlineColour=&H40000000,BorderStyle=3,Alignment=6")
-    ffmpeg.concat(
-        intermediate, audio, v=1, a=1
-    ).output(output_path, **output_args) \
-        .run(quiet=True, overwrite_output=True)
+    return intermediate
+
+
+def find_cut_points(path: str, sample_interval: Optional[list],
+                    segment_count: int) -> Optional[list[float]]:
+    """
+    Splits the video (or its sample interval) into pieces of similar length at keyframes.
+
+    Returns timestamps of the piece boundaries, or None if the video can't be split.
+    """
+    if sample_interval is not None:
+        start, end = float(sample_interval[0]), float(sample_interval[1])
+    else:
+        duration = probe(path)['format'].get('duration')
+        if duration is None:
+            return None
+        start, end = 0.0, float(duration)
+
+    frames = [frame for frame in keyframes(path) if start < frame < end]
+    cut_points = [start]
+    for index in range(1, segment_count):
+        target = start + (end - start) * index / segment_count
+        candidates = [frame for frame in frames if frame > cut_points[-1]]
+        if len(candidates) == 0:
+            break
+        cut_points.append(min(candidates, key=lambda frame, target=target: abs(frame - target)))
+    cut_points.append(end)
+
+    if len(cut_points) < 3:
+        return None
+    return cut_points
+
+
+def hard_subtitles_segmented(input_path: str, output_path: str,
+                             transcribed: SubtitlesTempFile, translated: SubtitlesTempFile,
+                             cut_points: list[float], job_dir: str, encode_args: dict) -> None:
+    piece_count = len(cut_points) - 1
+    logger.info("Burning subtitles in %d parallel pieces...", piece_count)
+
+    encode_args = dict(encode_args)
+    if 'threads' not in encode_args:
+        encode_args['threads'] = str(max(1, (os.cpu_count() or 1) // piece_count))
+
+    def burn_piece(index: int) -> str:
+        start, end = cut_points[index], cut_points[index + 1]
+        piece_path = os.path.join(job_dir, f"piece_{index:04d}.mp4")
+
+        # Subtitle timings are relative to the first cut point, so frames are shifted
+        # there for the subtitles filter and moved back to zero afterwards
+        video = ffmpeg.input(input_path, ss=str(start), t=str(end - start)).video
+        video = video.filter('setpts', f'PTS+{start - cut_points[0]}/TB')
+        video = burn_subtitles(video, transcribed, translated)
+        video = video.filter('setpts', 'PTS-STARTPTS')
+        video.output(piece_path, **encode_args).run(quiet=True, overwrite_output=True)
+        return piece_path
+
+    with ThreadPoolExecutor(max_workers=piece_count, thread_name_prefix="burn") as executor:
+        pieces = list(executor.map(burn_piece, range(piece_count)))
+
+    list_path = os.path.join(job_dir, "pieces.txt")
+    with open(list_path, "w", encoding="utf-8") as list_file:
+        for piece in pieces:
+            escaped_path = os.path.abspath(piece).replace("'", "'\\''")
+            list_file.write(f"file '{escaped_path}'\n")
+
+    video = ffmpeg.input(list_path, format='concat', safe=0)
+    source = ffmpeg.input(input_path, ss=str(cut_points[0]), t=str(cut_points[-1] - cut_points[0]))
+    ffmpeg.output(
+        video.video, source['a:0'], output_path, vcodec='copy', acodec=audio_codec(input_path, 0)
+    ).run(quiet=True, overwrite_output=True)
+
+
+def audio_codec(path: str, stream_index: Optional[int] = None) -> str:
+    """
+    Returns 'copy' if the source audio (or only its audio stream `stream_index`) can be stored
+    in an mp4 container as is, 'aac' otherwise.
+    """
+    streams = audio_streams(probe(path))
+    if stream_index is not None:
+        streams = streams[stream_index:stream_index + 1]
+    if len(streams) > 0 and all(stream.get('codec_name') in MP4_AUDIO_CODECS for stream in streams):
+        return 'copy'
+    return 'aac'
 
 
 def soft_subtitles(input_path: str, output_path: str,
-                   transcribed: SubtitlesTempFile, translated: SubtitlesTempFile,
+                   subtitles: list[Union[SubtitlesTempFile, SubtitlesPipe]],
                    input_args: dict, output_args: dict) -> None:
     output_args['c'] = 'copy'
     output_args['c:s'] = 'mov_text'
-    output_args['metadata:s:s:0'] = f'language={transcribed.subtitles.language}'
 
     input_stream = ffmpeg.input(input_path, **input_args)
-    subtitle_stream = ffmpeg.input(transcribed.tmp_file_path)
+    subtitle_streams = []
+    pipes = []
+    for index, source in enumerate(subtitles):
+        output_args[f'metadata:s:s:{index}'] = f'language={source.subtitles.language}'
+        if isinstance(source, SubtitlesPipe):
+            pipes.append(source)
+            subtitle_streams.append(ffmpeg.input(source.url, format='srt'))
+        else:
+            subtitle_streams.append(ffmpeg.input(source.tmp_file_path))
 
-    if translated.tmp_file is None:
-        ffmpeg.output(
-            input_stream, subtitle_stream, output_path, **output_args
-        ).run(quiet=True, overwrite_output=True)
-    else:
-        output_args['metadata:s:s:1'] = f'language={translated.subtitles.language}'
-        translated_stream = ffmpeg.input(translated.tmp_file_path)
-        ffmpeg.output(
-            input_stream, subtitle_stream, translated_stream, output_path, **output_args
-        ).run(quiet=True, overwrite_output=True)
+    output = ffmpeg.output(
+        input_stream, *subtitle_streams, output_path, **output_args
+    ).overwrite_output()
+
+    if len(pipes) == 0:
+        output.run(quiet=True)
+        return
+
+    with subprocess.Popen(output.compile(), pass_fds=[pipe.read_fd for pipe in pipes],
+                          stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                          stderr=subprocess.PIPE) as process:
+        for pipe in pipes:
+            pipe.start()
+        _, err = process.communicate()
+
+    if process.returncode != 0:
+        raise ffmpeg.Error('ffmpeg', None, err)
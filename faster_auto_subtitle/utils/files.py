@@ -1,19 +1,82 @@
 import os
+import threading
 from typing import TextIO, Iterator
 from faster_whisper.transcribe import Segment
 from .convert import format_timestamp
 
+# Number of cues formatted before they are written out together
+WRITE_BATCH_SIZE = 1024
+WRITE_BUFFER_SIZE = 1024 * 1024
+
 
 def write_srt(transcript: Iterator[Segment], file: TextIO) -> None:
+    cues = []
+    previous_end = None
+    previous_end_timestamp = ""
     for i, segment in enumerate(transcript, start=1):
-        print(
-            f"{i}\n"
-            f"{format_timestamp(segment.start, always_include_hours=True)} --> "
-            f"{format_timestamp(segment.end, always_include_hours=True)}\n"
-            f"{segment.text.strip().replace('-->', '->')}\n",
-            file=file,
-            flush=True,
-        )
+        # Consecutive segments usually share a boundary, reuse its formatted timestamp
+        if segment.start == previous_end:
+            start_timestamp = previous_end_timestamp
+        else:
+            start_timestamp = format_timestamp(segment.start, always_include_hours=True)
+        previous_end = segment.end
+        previous_end_timestamp = format_timestamp(segment.end, always_include_hours=True)
+
+        cues.append(f"{i}\n"
+                    f"{start_timestamp} --> {previous_end_timestamp}\n"
+                    f"{segment.text.strip().replace('-->', '->')}\n\n")
+        if len(cues) >= WRITE_BATCH_SIZE:
+            file.write("".join(cues))
+            cues.clear()
+
+    file.write("".join(cues))
+    file.flush()
+
+
+def save_srt(transcript: Iterator[Segment], path: str) -> None:
+    """
+    Writes subtitles to a temporary file next to `path` and renames it into place once complete,
+    so that `path` never contains a partially written file.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8", buffering=WRITE_BUFFER_SIZE) as srt:
+            write_srt(transcript, file=srt)
+            os.fsync(srt.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class SubtitleStream:
+    """
+    Writes cues one by one as they are finalized, flushing each of them,
+    so that the file can be followed while it is being written.
+    """
+
+    def __init__(self, file: TextIO, subtitle_format: str = 'srt'):
+        self.file = file
+        self.subtitle_format = subtitle_format
+        self.count = 0
+        if subtitle_format == 'vtt':
+            self.file.write("WEBVTT\n\n")
+            self.file.flush()
+
+    def timestamp(self, seconds: float) -> str:
+        timestamp = format_timestamp(seconds, always_include_hours=True)
+        return timestamp.replace(',', '.') if self.subtitle_format == 'vtt' else timestamp
+
+    def write(self, segments: Iterator[Segment]) -> None:
+        cues = []
+        for segment in segments:
+            self.count += 1
+            cues.append(f"{self.count}\n"
+                        f"{self.timestamp(segment.start)} --> {self.timestamp(segment.end)}\n"
+                        f"{segment.text.strip().replace('-->', '->')}\n\n")
+        self.file.write("".join(cues))
+        self.file.flush()
 
 
 def filename(path: str) -> str:
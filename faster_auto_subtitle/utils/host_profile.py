@@ -0,0 +1,75 @@
+import os
+import json
+import logging
+import platform
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROFILE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "faster_auto_subtitle",
+                                    "autotune.json")
+
+
+def resolve_device(device: str) -> str:
+    if device != "auto":
+        return device
+
+    import ctranslate2  # pylint: disable=C0415
+    return "cuda" if ctranslate2.get_cuda_device_count() > 0 else "cpu"
+
+
+def profile_key(model_name: str, device: str) -> str:
+    return f"{model_name}/{resolve_device(device)}"
+
+
+def load_profile(path: str = DEFAULT_PROFILE_PATH) -> dict:
+    """
+    Returns the tuned configurations of this host, keyed by `profile_key`.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as profile_file:
+            profiles = json.load(profile_file)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as exc:
+        logger.warning("Unable to read host profile %s: %s", path, exc)
+        return {}
+
+    return profiles.get(platform.node(), {})
+
+
+def save_profile_entry(key: str, entry: dict, path: str = DEFAULT_PROFILE_PATH) -> None:
+    profiles = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as profile_file:
+            profiles = json.load(profile_file)
+
+    profiles.setdefault(platform.node(), {})[key] = entry
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as profile_file:
+        json.dump(profiles, profile_file, indent=2)
+    os.replace(tmp_path, path)
+
+
+def apply_host_profile(model_args: dict, path: str = DEFAULT_PROFILE_PATH) -> dict:
+    """
+    Fills compute_type and cpu_threads left at their defaults from the profile of this host.
+    """
+    if model_args.get("compute_type", "default") != "default" and model_args.get("cpu_threads"):
+        return model_args
+
+    entry: Optional[dict] = load_profile(path).get(
+        profile_key(model_args["model_size_or_path"], model_args.get("device", "auto")))
+    if entry is None:
+        return model_args
+
+    model_args = dict(model_args)
+    if model_args.get("compute_type", "default") == "default":
+        model_args["compute_type"] = entry["compute_type"]
+    if not model_args.get("cpu_threads") and entry.get("cpu_threads"):
+        model_args["cpu_threads"] = entry["cpu_threads"]
+
+    logger.info("Using tuned configuration for this host: compute_type=%s, cpu_threads=%s",
+                model_args["compute_type"], model_args.get("cpu_threads") or "default")
+    return model_args
@@ -0,0 +1,64 @@
+import os
+import json
+import socket
+import tempfile
+import threading
+from typing import BinaryIO, Iterator, Union
+
+if hasattr(socket, "AF_UNIX"):
+    DEFAULT_ADDRESS = os.path.join(tempfile.gettempdir(), "faster_auto_subtitle.sock")
+else:
+    DEFAULT_ADDRESS = "localhost:8765"
+
+
+def parse_address(address: str) -> tuple[int, Union[str, tuple[str, int]]]:
+    """
+    Returns the socket family and address for either `host:port` or a Unix socket path.
+    """
+    host, separator, port = address.rpartition(':')
+    if separator and port.isdigit() and os.sep not in host:
+        return socket.AF_INET, (host or "localhost", int(port))
+
+    if not hasattr(socket, "AF_UNIX"):
+        raise ValueError(f"Unix sockets are not supported on this platform, use host:port, got {address}")
+    return socket.AF_UNIX, address
+
+
+def connect(address: str) -> socket.socket:
+    family, socket_address = parse_address(address)
+    connection = socket.socket(family, socket.SOCK_STREAM)
+    try:
+        connection.connect(socket_address)
+    except OSError:
+        connection.close()
+        raise
+    return connection
+
+
+def read_messages(stream: BinaryIO) -> Iterator[dict]:
+    for line in stream:
+        yield json.loads(line)
+
+
+class MessageWriter:
+    """
+    Writes newline-delimited JSON messages to a stream shared by several threads.
+
+    Once the other side disconnects, further messages are dropped.
+    """
+
+    def __init__(self, stream: BinaryIO):
+        self.stream = stream
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def send(self, message: dict) -> None:
+        data = (json.dumps(message) + "\n").encode("utf-8")
+        with self.lock:
+            if self.closed:
+                return
+            try:
+                self.stream.write(data)
+                self.stream.flush()
+            except (OSError, ValueError):
+                self.closed = True
@@ -0,0 +1,105 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from typing import Any, Callable, Optional
+import ffmpeg
+
+logger = logging.getLogger(__name__)
+
+
+class ProbeCache:
+    """
+    Caches ffprobe results so every stage reuses a single probe per input file.
+
+    Results are kept in memory and, if `cache_dir` is set, persisted as JSON files.
+    Entries are keyed by (absolute path, size, mtime, probe arguments),
+    so a modified file is probed again. With `extract`, only the part of the result it
+    returns is cached, which keeps large outputs such as packet lists out of the cache.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None):
+        self.cache_dir = cache_dir
+        self.entries: dict[tuple, dict] = {}
+        self.lock = threading.Lock()
+
+    def probe(self, path: str, extract: Optional[Callable[[dict], Any]] = None, **probe_args) -> Any:
+        key_args = probe_args if extract is None else dict(probe_args, extract=extract.__name__)
+        key = self.make_key(path, key_args)
+        with self.lock:
+            if key in self.entries:
+                return self.entries[key]
+
+        info = self.load(key)
+        if info is None:
+            info = ffmpeg.probe(path, **probe_args)
+            if extract is not None:
+                info = extract(info)
+            self.store(key, info)
+
+        with self.lock:
+            self.entries[key] = info
+        return info
+
+    @staticmethod
+    def make_key(path: str, probe_args: dict) -> tuple:
+        stat = os.stat(path)
+        return os.path.abspath(path), stat.st_size, stat.st_mtime_ns, \
+            json.dumps(probe_args, sort_keys=True)
+
+    def cache_path(self, key: tuple) -> str:
+        digest = hashlib.sha1(json.dumps(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.json")
+
+    def load(self, key: tuple) -> Optional[Any]:
+        if self.cache_dir is None:
+            return None
+
+        try:
+            with open(self.cache_path(key), "r", encoding="utf-8") as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError):
+            return None
+
+    def store(self, key: tuple, info: Any) -> None:
+        if self.cache_dir is None:
+            return
+
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{self.cache_path(key)}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as cache_file:
+                json.dump(info, cache_file)
+            os.replace(tmp_path, self.cache_path(key))
+        except OSError as exc:
+            logger.warning("Unable to store probe result in %s: %s", self.cache_dir, exc)
+
+
+_probe_cache = ProbeCache()
+
+
+def set_probe_cache_dir(cache_dir: Optional[str]) -> None:
+    _probe_cache.cache_dir = cache_dir
+
+
+def probe(path: str, **probe_args) -> dict:
+    return _probe_cache.probe(path, **probe_args)
+
+
+def keyframes(path: str) -> list[float]:
+    """
+    Returns timestamps of the first video stream's keyframes, relative to the start of the file.
+    """
+    return _probe_cache.probe(path, extract=keyframe_times, select_streams='v:0',
+                              show_entries='packet=pts_time,flags')
+
+
+def keyframe_times(info: dict) -> list[float]:
+    start_time = float(info.get('format', {}).get('start_time', 0) or 0)
+    return sorted(float(packet['pts_time']) - start_time for packet in info.get('packets') or []
+                  if 'K' in packet.get('flags', '') and packet.get('pts_time', 'N/A') != 'N/A')
+
+
+def audio_streams(info: dict) -> list[dict]:
+    return [stream for stream in info.get('streams') or [] if stream.get('codec_type') == 'audio']
@@ -1,14 +1,19 @@
 import tempfile
 import os
+import re
 import shutil
-from typing import TextIO, cast
+import threading
+from typing import Optional, TextIO, cast
 from faster_auto_subtitle.models.subtitles import Subtitles
 from faster_auto_subtitle.utils.files import write_srt
 
+FILTER_SAFE_PATH = re.compile(r'^[\w./ -]+$')
+
 
 class SubtitlesTempFile:
-    def __init__(self, subtitles: Subtitles):
+    def __init__(self, subtitles: Subtitles, directory: str = '.'):
         self.subtitles = subtitles
+        self.directory = directory
         self.tmp_file = None
         self.tmp_file_path = None
 
@@ -16,19 +21,84 @@ class SubtitlesTempFile:
         if self.subtitles is None:
             return self
 
-        self.tmp_file = tempfile.NamedTemporaryFile('w', encoding="utf-8", dir='.', delete=False)
-        self.tmp_file_path = os.path.relpath(self.tmp_file.name, '.')
+        # Subtitles already saved to disk are used in place, unless the path
+        # can't be passed to an ffmpeg filter as is
+        saved = self.subtitles.output_path is not None and os.path.isfile(self.subtitles.output_path)
+        if saved:
+            saved_path = relative_path(self.subtitles.output_path)
+            if saved_path is not None and FILTER_SAFE_PATH.match(saved_path):
+                self.tmp_file_path = saved_path
+                return self
+
+        self.tmp_file = tempfile.NamedTemporaryFile('w', encoding="utf-8", suffix='.srt',
+                                                    dir=self.directory, delete=False)
+        self.tmp_file_path = relative_path(self.tmp_file.name) or self.tmp_file.name
 
-        if self.subtitles.output_path is not None and os.path.isfile(self.subtitles.output_path):
+        if saved:
+            self.tmp_file.close()
             shutil.copyfile(self.subtitles.output_path, self.tmp_file_path)
         else:
             write_srt(self.subtitles.segments, cast(TextIO, self.tmp_file))
+            self.tmp_file.close()
         return self
 
     def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
-        if self.subtitles is None:
+        if self.tmp_file is None:
             return
 
         self.tmp_file.close()
         if os.path.isfile(self.tmp_file_path):
             os.remove(self.tmp_file_path)
+
+
+class SubtitlesPipe:
+    """
+    Streams subtitles in SRT format to a child process through an inherited pipe.
+
+    The read end is passed to the child (e.g. as `pipe:<fd>` input of ffmpeg), call `start`
+    once the child is spawned to begin writing the subtitles from a background thread.
+    """
+
+    def __init__(self, subtitles: Subtitles):
+        self.subtitles = subtitles
+        self.read_fd: Optional[int] = None
+        self.write_fd: Optional[int] = None
+        self.writer: Optional[threading.Thread] = None
+
+    def __enter__(self):
+        self.read_fd, self.write_fd = os.pipe()
+        return self
+
+    @property
+    def url(self) -> str:
+        return f"pipe:{self.read_fd}"
+
+    def start(self) -> None:
+        os.close(self.read_fd)
+        self.read_fd = None
+        self.writer = threading.Thread(target=self.write, args=(self.write_fd,), daemon=True)
+        self.write_fd = None
+        self.writer.start()
+
+    def write(self, write_fd: int) -> None:
+        try:
+            with os.fdopen(write_fd, 'w', encoding="utf-8") as pipe:
+                write_srt(self.subtitles.segments, cast(TextIO, pipe))
+        except BrokenPipeError:
+            pass
+
+    def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
+        for fd in (self.read_fd, self.write_fd):
+            if fd is not None:
+                os.close(fd)
+        if self.writer is not None:
+            self.writer.join()
+
+
+def relative_path(path: str) -> Optional[str]:
+    # HACK: ffmpeg filters can't take absolute paths on Windows, see ffmpeg.add_subtitles
+    try:
+        return os.path.relpath(path, '.')
+    except ValueError:
+        # Windows can't make a relative path across drives
+        return None
@@ -0,0 +1,103 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+import dataclasses
+from typing import Iterable, Iterator, Optional
+import numpy as np
+from faster_whisper.transcribe import Segment, Word
+
+logger = logging.getLogger(__name__)
+
+
+class TranscriptCache:
+    """
+    On-disk cache of transcriptions keyed by the decoded audio and the recognition parameters.
+
+    Every entry is a JSON file named after the SHA-256 of the PCM samples, model arguments
+    and transcribe arguments. Entries are evicted least recently used first once the total
+    size exceeds `max_size` bytes, a cache hit refreshes the entry's modification time.
+    """
+
+    def __init__(self, cache_dir: str, max_size: int):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(audio: np.ndarray, model_args: dict, transcribe_args: dict) -> str:
+        digest = hashlib.sha256()
+        digest.update(np.ascontiguousarray(audio, dtype=np.float32).data)
+        digest.update(json.dumps([model_args, transcribe_args], sort_keys=True,
+                                 default=str).encode("utf-8"))
+        return digest.hexdigest()
+
+    def entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str) -> Optional[tuple[list[Segment], str]]:
+        path = self.entry_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as entry_file:
+                entry = json.load(entry_file)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+
+        segments = [to_segment(segment) for segment in entry["segments"]]
+        return segments, entry["language"]
+
+    def put(self, key: str, segments: list[Segment], language: str) -> None:
+        entry = {
+            "language": language,
+            "segments": [dataclasses.asdict(segment) for segment in segments]
+        }
+        path = self.entry_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as entry_file:
+                json.dump(entry, entry_file)
+            os.replace(tmp_path, path)
+        except OSError as exc:
+            logger.warning("Unable to store transcript in %s: %s", self.cache_dir, exc)
+            return
+
+        self.evict()
+
+    def evict(self) -> None:
+        with self.lock:
+            entries = []
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith(".json"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+            total_size = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total_size <= self.max_size:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total_size -= size
+
+    def cached_iterator(self, key: str, segments: Iterable[Segment],
+                        language: str) -> Iterator[Segment]:
+        """
+        Yields segments as they are produced and stores them once the transcription completes.
+        """
+        collected = []
+        for segment in segments:
+            collected.append(segment)
+            yield segment
+        self.put(key, collected, language)
+
+
+def to_segment(data: dict) -> Segment:
+    words = data.get("words")
+    if words is not None:
+        words = [Word(**word) for word in words]
+    return Segment(**dict(data, words=words))
@@ -0,0 +1,119 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from typing import Iterable
+
+logger = logging.getLogger(__name__)
+
+# SQLite limits the number of variables in a single statement
+QUERY_CHUNK_SIZE = 500
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.split())
+
+
+class TranslationMemory:
+    """
+    Sentence-level translation memory stored in SQLite, shared across runs, processes and backends.
+
+    Translations are keyed by backend, model, source and target language and the normalized
+    source text. Once more than `max_entries` translations are stored, the least recently
+    used ones are removed first.
+    """
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS translations ("
+                "backend TEXT, model TEXT, source_lang TEXT, target_lang TEXT, source TEXT, "
+                "translation TEXT, last_used REAL, "
+                "PRIMARY KEY (backend, model, source_lang, target_lang, source)) WITHOUT ROWID")
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS translations_last_used ON translations (last_used)")
+        self.entries = self.count()
+
+    def count(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+
+    def lookup(self, backend: str, model: str, source_lang: str, target_lang: str,
+               texts: Iterable[str]) -> dict[str, str]:
+        """
+        Returns the stored translations of `texts`, keyed by their normalized text.
+        """
+        sources = list(dict.fromkeys(normalize(text) for text in texts))
+        found = {}
+        now = time.time()
+        with self.lock:
+            try:
+                with self.connection:
+                    for start in range(0, len(sources), QUERY_CHUNK_SIZE):
+                        chunk = sources[start:start + QUERY_CHUNK_SIZE]
+                        rows = self.connection.execute(
+                            "SELECT source, translation FROM translations "
+                            "WHERE backend = ? AND model = ? AND source_lang = ? AND target_lang = ? "
+                            f"AND source IN ({','.join('?' * len(chunk))})",
+                            [backend, model, source_lang, target_lang, *chunk])
+                        found.update(rows)
+                    self.connection.executemany(
+                        "UPDATE translations SET last_used = ? WHERE backend = ? AND model = ? "
+                        "AND source_lang = ? AND target_lang = ? AND source = ?",
+                        [(now, backend, model, source_lang, target_lang, source) for source in found])
+            except sqlite3.Error as exc:
+                logger.warning("Unable to read translation memory %s: %s", self.path, exc)
+                found = {}
+
+            self.hits += len(found)
+            self.misses += len(sources) - len(found)
+        return found
+
+    def store(self, backend: str, model: str, source_lang: str, target_lang: str,
+              translations: Iterable[tuple[str, str]]) -> None:
+        now = time.time()
+        rows = [(backend, model, source_lang, target_lang, normalize(source), translation, now)
+                for source, translation in translations if translation is not None]
+        with self.lock:
+            try:
+                with self.connection:
+                    before = self.connection.total_changes
+                    self.connection.executemany(
+                        "INSERT OR IGNORE INTO translations VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+                    self.entries += self.connection.total_changes - before
+                if self.entries > self.max_entries:
+                    self.evict()
+            except sqlite3.Error as exc:
+                logger.warning("Unable to store translations in %s: %s", self.path, exc)
+
+    def evict(self) -> None:
+        with self.connection:
+            # Other processes may have added or evicted entries in the meantime
+            self.entries = self.count()
+            if self.entries > self.max_entries:
+                self.connection.execute(
+                    "DELETE FROM translations WHERE (backend, model, source_lang, target_lang, source) "
+                    "IN (SELECT backend, model, source_lang, target_lang, source FROM translations "
+                    "ORDER BY last_used LIMIT ?)", (self.entries - self.max_entries,))
+                self.entries = self.max_entries
+
+    def log_stats(self) -> None:
+        """
+        Logs the hit rate since the last call.
+        """
+        with self.lock:
+            hits, misses = self.hits, self.misses
+            self.hits = self.misses = 0
+
+        if hits + misses > 0:
+            logger.info("Translation memory: %d of %d sentences found (%.0f%% hit rate), %d stored.",
+                        hits, hits + misses, 100 * hits / (hits + misses), self.entries)
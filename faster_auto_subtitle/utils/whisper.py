@@ -1,8 +1,33 @@
+import os
+import logging
 import warnings
-from typing import Iterable
-from faster_whisper import WhisperModel
+import threading
+import dataclasses
+import multiprocessing
+from bisect import bisect_right
+from itertools import accumulate, chain
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Iterable, Optional, Union
+import numpy as np
+from faster_whisper import BatchedInferencePipeline, WhisperModel, decode_audio
 from faster_whisper.transcribe import Segment, TranscriptionInfo
 from tqdm import tqdm
+from .checkpoint import CheckpointJournal
+from .convert import format_timestamp
+from .ffmpeg import SAMPLE_RATE
+from .transcript_cache import TranscriptCache
+
+logger = logging.getLogger(__name__)
+
+# Longest clip that fits into a single Whisper window
+CLIP_MAX_DURATION = 30
+# Chunks shorter than this are not worth the context lost at the cut point
+MIN_CHUNK_DURATION = 60
+# How far from the even split point to look for a silent frame, in seconds
+SPLIT_SEARCH_WINDOW = 30
+SPLIT_FRAME_DURATION = 0.1
+# Audio added around a low-confidence range before it is decoded again, in seconds
+REFINE_PADDING = 0.2
 
 
 class WhisperAI:
@@ -18,7 +43,7 @@ class WhisperAI:
     whisper = WhisperAI(model_args, transcribe_args)
 
     # Transcribe an audio file and iterate over the segments
-    for segment in whisper.transcribe(audio_path):
+    for segment in whisper.transcribe(audio):
         # Process each transcription segment
         print(segment)
     ```
@@ -30,40 +55,370 @@ class WhisperAI:
         - compute_type (str): The type to use for computation.
             See https://opennmt.net/CTranslate2/quantization.html.
     - transcribe_args (dict): Additional arguments to pass to the transcribe method.
+    - parallel_chunks (int): If greater than 1, long audio is split at silences into this many
+        chunks which are transcribed in worker processes, each with its own model instance.
+    - transcript_cache (TranscriptCache): Optional cache of finished transcriptions.
+    - batch_size (int): If greater than 0, speech is split into chunks with VAD and decoded
+        in batches of this size with faster-whisper's BatchedInferencePipeline.
+    - model (faster_whisper.WhisperModel): Already loaded model to use instead of loading
+        one from model_args.
+    - checkpoint_dir (str): If set, segments are journaled to this directory as they are
+        produced, and an interrupted transcription of the same audio resumes where it stopped.
+    - refine_model (faster_whisper.WhisperModel): Optional larger model, which decodes again
+        the time ranges of segments that fall outside the thresholds in refine_args.
+    - refine_args (dict): Name of the refine model ("model") and the thresholds for segments:
+        "avg_logprob" (minimum), "compression_ratio" and "no_speech_prob" (maximum).
 
     Attributes:
     - model (faster_whisper.WhisperModel): The underlying Whisper speech recognition model.
     - transcribe_args (dict): Additional arguments used for transcribe method.
 
     Methods:
-    - transcribe(audio_path): Transcribes an audio file and yields the resulting segments.
+    - transcribe(audio): Transcribes an audio file or waveform and yields the resulting segments.
+    - transcribe_clips(clips): Transcribes several short waveforms together in shared batches.
     """
 
-    def __init__(self, model_args: dict, transcribe_args: dict):
-        self.model = WhisperModel(**model_args)
+    def __init__(self, model_args: dict, transcribe_args: dict, parallel_chunks: int = 0,
+                 transcript_cache: Optional[TranscriptCache] = None, batch_size: int = 0,
+                 model: Optional[WhisperModel] = None, checkpoint_dir: Optional[str] = None,
+                 refine_model: Optional[WhisperModel] = None, refine_args: Optional[dict] = None):
+        self.model = model if model is not None else WhisperModel(**model_args)
+        self.batch_size = batch_size
+        self.inference, self.inference_args = make_inference(self.model, batch_size)
+        self.model_args = model_args
         self.transcribe_args = transcribe_args
         self.model_name = model_args.get("model_size_or_path", "")
+        self.parallel_chunks = parallel_chunks
+        self.chunk_pool: Optional[ProcessPoolExecutor] = None
+        self.chunk_pool_lock = threading.Lock()
+        self.transcript_cache = transcript_cache
+        self.checkpoint_dir = checkpoint_dir
+        self.refine_model = refine_model
+        self.refine_args = refine_args or {}
 
-    def transcribe(self, audio_path: str) -> tuple[Iterable[Segment], str]:
+    def transcribe(self, audio: Union[str, np.ndarray]) -> tuple[Iterable[Segment], str]:
         """
-        Transcribes the specified audio file and yields the resulting segments.
+        Transcribes the specified audio and yields the resulting segments.
 
         Args:
-        - audio_path (str): The path to the audio file for transcription.
+        - audio (str | np.ndarray): The path to the audio file or a 16 kHz mono float32 waveform.
 
         Yields:
         - faster_whisper.TranscriptionSegment: An individual transcription segment.
         """
+        if self.transcript_cache is None:
+            return self.transcribe_audio(audio)
+
+        if not isinstance(audio, np.ndarray):
+            audio = decode_audio(audio, sampling_rate=SAMPLE_RATE)
+
+        # Chunked transcription may differ slightly at the cut points, so it is cached separately
+        key = self.cache_key(audio, parallel_chunks=self.parallel_chunks,
+                             batch_size=self.batch_size)
+        cached = self.transcript_cache.get(key)
+        if cached is not None:
+            logger.info("Using cached transcription.")
+            return cached
+
+        segments, language = self.transcribe_audio(audio)
+        return self.transcript_cache.cached_iterator(key, segments, language), language
+
+    def cache_key(self, audio: np.ndarray, **mode_args) -> str:
+        # Thread settings don't change the result
+        model_args = {name: value for name, value in self.model_args.items()
+                      if name not in ("cpu_threads", "num_workers")}
+        if self.refine_model is not None:
+            mode_args = dict(mode_args, refine=self.refine_args)
+        return TranscriptCache.make_key(audio, model_args, dict(self.transcribe_args, **mode_args))
+
+    def transcribe_clips(self, clips: list[np.ndarray]) -> list[tuple[list[Segment], str]]:
+        """
+        Transcribes several short clips (up to 30 seconds each) together.
+
+        Clips are concatenated and passed to the batched pipeline with one clip per chunk,
+        so they share encoder and decoder batches. Clips are grouped by language first,
+        because the pipeline decodes a whole batch with a single language.
+
+        Returns a list of (segments, language) with timestamps relative to each clip.
+        """
+        results: list = [None] * len(clips)
+        keys: list = [None] * len(clips)
+        if self.transcript_cache is not None:
+            for index, clip in enumerate(clips):
+                keys[index] = self.cache_key(clip, clip_batch=True)
+                results[index] = self.transcript_cache.get(keys[index])
+
+        groups: dict[str, list[int]] = {}
+        for index, clip in enumerate(clips):
+            if results[index] is not None:
+                continue
+            language = self.transcribe_args.get("language")
+            if language is None:
+                language, _, _ = self.model.detect_language(clip)
+            groups.setdefault(language, []).append(index)
+
+        for language, indexes in groups.items():
+            group_segments = self.transcribe_clip_group([clips[index] for index in indexes],
+                                                        language)
+            if "distil" in self.model_name:
+                language = "en"
+
+            for index, segments in zip(indexes, group_segments):
+                segments = list(self.refined(clips[index], segments, language, log_summary=False))
+                results[index] = (segments, language)
+                if self.transcript_cache is not None:
+                    self.transcript_cache.put(keys[index], segments, language)
+
+        return results
+
+    def transcribe_clip_group(self, clips: list[np.ndarray], language: str) -> list[list[Segment]]:
+        offsets = list(accumulate((len(clip) for clip in clips), initial=0))
+        clip_timestamps = [{"start": start / SAMPLE_RATE, "end": end / SAMPLE_RATE}
+                           for start, end in zip(offsets, offsets[1:])]
+
+        pipeline = self.inference
+        if not isinstance(pipeline, BatchedInferencePipeline):
+            pipeline = BatchedInferencePipeline(model=self.model)
+
+        transcribe_args = dict(self.transcribe_args, language=language, vad_filter=False,
+                               clip_timestamps=clip_timestamps, without_timestamps=False,
+                               batch_size=self.batch_size or len(clips))
+        warnings.filterwarnings("ignore")
+        segments, info = pipeline.transcribe(np.concatenate(clips), **transcribe_args)
+        warnings.filterwarnings("default")
+
+        clip_segments: list[list[Segment]] = [[] for _ in clips]
+        for segment in self.subtitles_iterator(segments, info):
+            # Timestamps are rounded to milliseconds, so a segment starting right at a clip
+            # boundary may start slightly before it: its midpoint is always inside its clip
+            midpoint = (segment.start + segment.end) / 2 * SAMPLE_RATE
+            index = min(max(bisect_right(offsets, midpoint) - 1, 0), len(clips) - 1)
+            clip_segments[index].append(shift_segment(segment, -offsets[index] / SAMPLE_RATE))
+        return clip_segments
+
+    def transcribe_audio(self, audio: Union[str, np.ndarray]) -> tuple[Iterable[Segment], str]:
+        if (self.parallel_chunks > 1 or self.refine_model is not None) and \
+                not isinstance(audio, np.ndarray):
+            audio = decode_audio(audio, sampling_rate=SAMPLE_RATE)
+
+        if self.parallel_chunks > 1:
+            split_points = find_split_points(audio, self.parallel_chunks)
+            if len(split_points) > 2:
+                return self.transcribe_chunks(audio, split_points)
+
+        if self.checkpoint_dir is not None:
+            return self.transcribe_checkpointed(audio)
+
+        warnings.filterwarnings("ignore")
+        segments, info = self.inference.transcribe(
+            audio, **self.transcribe_args, **self.inference_args)
+        warnings.filterwarnings("default")
+
+        language = info.language
+        if "distil" in self.model_name:
+            language = "en"
+
+        return self.refined(audio, self.subtitles_iterator(segments, info), language), language
+
+    def transcribe_checkpointed(self, audio: Union[str, np.ndarray]) -> tuple[Iterable[Segment], str]:
+        """
+        Transcribes the audio while journaling the segments, resuming a previous attempt
+        from its last recorded segment by seeking the audio to its end.
+        """
+        if not isinstance(audio, np.ndarray):
+            audio = decode_audio(audio, sampling_rate=SAMPLE_RATE)
+
+        key = self.cache_key(audio, batch_size=self.batch_size)
+        journal = CheckpointJournal(os.path.join(self.checkpoint_dir, f"{key}.jsonl"))
+        recorded, language = journal.load()
+
+        transcribe_args = dict(self.transcribe_args)
+        offset = 0.0
+        if language is not None:
+            transcribe_args["language"] = language
+        if len(recorded) > 0:
+            offset = recorded[-1].end
+            logger.info("Resuming transcription from %s.", format_timestamp(offset))
+            if transcribe_args.get("condition_on_previous_text") and \
+                    transcribe_args.get("initial_prompt") is None:
+                transcribe_args["initial_prompt"] = recorded[-1].text.strip()
+
+        remaining = audio[int(offset * SAMPLE_RATE):]
+        if len(remaining) == 0:
+            return journal.record(language, recorded, []), language
+
+        warnings.filterwarnings("ignore")
+        segments, info = self.inference.transcribe(
+            remaining, **transcribe_args, **self.inference_args)
+        warnings.filterwarnings("default")
+
+        if language is None:
+            language = info.language
+            if "distil" in self.model_name:
+                language = "en"
+
+        segments = (shift_segment(segment, offset) for segment in
+                    self.refined(remaining, self.subtitles_iterator(segments, info), language))
+        return journal.record(language, recorded, segments), language
+
+    def transcribe_window(self, audio: np.ndarray, **transcribe_args) -> tuple[list[Segment], str]:
+        """
+        Transcribes a short waveform at once, without a progress bar.
+        `transcribe_args` override the arguments the model was created with.
+        """
         warnings.filterwarnings("ignore")
-        segments, info = self.model.transcribe(
-            audio_path, **self.transcribe_args)
+        segments, info = self.inference.transcribe(
+            audio, **dict(self.transcribe_args, **transcribe_args), **self.inference_args)
+        segments = list(segments)
         warnings.filterwarnings("default")
 
         language = info.language
         if "distil" in self.model_name:
             language = "en"
 
-        return self.subtitles_iterator(segments, info), language
+        return segments, language
+
+    def transcribe_chunks(self, audio: np.ndarray,
+                          split_points: list[int]) -> tuple[Iterable[Segment], str]:
+        """
+        Transcribes the chunks between `split_points` in parallel processes.
+
+        With a checkpoint directory the stitched segments are journaled, and a previous attempt
+        is resumed by transcribing only the chunks that were not finished.
+        """
+        transcribe_args = dict(self.transcribe_args)
+        journal = None
+        recorded: list[Segment] = []
+        offset = 0.0
+        if self.checkpoint_dir is not None:
+            key = self.cache_key(audio, parallel_chunks=self.parallel_chunks,
+                                 batch_size=self.batch_size)
+            journal = CheckpointJournal(os.path.join(self.checkpoint_dir, f"{key}.jsonl"))
+            recorded, recorded_language = journal.load()
+            if recorded_language is not None:
+                transcribe_args["language"] = recorded_language
+            if len(recorded) > 0:
+                offset = recorded[-1].end
+                logger.info("Resuming transcription from %s.", format_timestamp(offset))
+
+        # Detect the language once for the whole audio, so that all chunks agree on it
+        if transcribe_args.get("language") is None:
+            transcribe_args["language"], _, _ = self.model.detect_language(audio)
+
+        pool = self.get_chunk_pool()
+        # Split points only depend on the audio, so a resumed run cuts the same chunks
+        chunks = [pool.submit(transcribe_chunk, audio[start:end], start / SAMPLE_RATE,
+                              transcribe_args)
+                  for start, end in zip(split_points, split_points[1:])
+                  if end > offset * SAMPLE_RATE]
+
+        language = transcribe_args["language"]
+        if "distil" in self.model_name:
+            language = "en"
+
+        segments = self.chunks_iterator(chunks, len(audio) / SAMPLE_RATE - offset)
+        if offset > 0:
+            segments = (segment for segment in segments if segment.end > offset)
+        segments = self.refined(audio, segments, language)
+        if journal is not None:
+            segments = journal.record(language, recorded, segments)
+        return segments, language
+
+    def refined(self, audio: np.ndarray, segments: Iterable[Segment],
+                language: str, log_summary: bool = True) -> Iterable[Segment]:
+        if self.refine_model is None:
+            return segments
+        return self.refine_iterator(audio, segments, language, log_summary)
+
+    def needs_refinement(self, segment: Segment) -> bool:
+        return segment.avg_logprob < self.refine_args.get("avg_logprob", -1.0) or \
+            segment.compression_ratio > self.refine_args.get("compression_ratio", 2.4) or \
+            segment.no_speech_prob > self.refine_args.get("no_speech_prob", 0.6)
+
+    def refine_iterator(self, audio: np.ndarray, segments: Iterable[Segment],
+                        language: str, log_summary: bool = True) -> Iterable[Segment]:
+        """
+        Passes confident segments through and replaces each run of consecutive low-confidence
+        segments with the segments the refine model produces for the same time range.
+        """
+        pending: list[Segment] = []
+        previous: Optional[Segment] = None
+        segment_id = 0
+        total_count = 0
+        refined_count = 0
+        refined_duration = 0.0
+        for segment in chain(segments, [None]):
+            if segment is not None:
+                total_count += 1
+                if self.needs_refinement(segment):
+                    pending.append(segment)
+                    continue
+
+            if len(pending) > 0:
+                end_limit = segment.start if segment is not None else len(audio) / SAMPLE_RATE
+                start = max(pending[0].start - REFINE_PADDING, previous.end if previous else 0.0)
+                end = max(min(pending[-1].end + REFINE_PADDING, end_limit), start)
+                for refined_segment in self.refine_range(audio, start, end, language, previous):
+                    segment_id += 1
+                    yield dataclasses.replace(refined_segment, id=segment_id)
+                refined_count += len(pending)
+                refined_duration += end - start
+                pending = []
+
+            if segment is not None:
+                segment_id += 1
+                yield dataclasses.replace(segment, id=segment_id)
+                previous = segment
+
+        # Short pieces (clips, live windows) are refined one by one, a summary each would be noise
+        logger.log(logging.INFO if log_summary else logging.DEBUG,
+                   "Refined %d of %d segments (%.1f seconds) with %s.", refined_count,
+                   total_count, refined_duration, self.refine_args.get("model", "the refine model"))
+
+    def refine_range(self, audio: np.ndarray, start: float, end: float, language: str,
+                     previous: Optional[Segment]) -> list[Segment]:
+        transcribe_args = dict(self.transcribe_args, language=language)
+        if previous is not None and transcribe_args.get("initial_prompt") is None:
+            transcribe_args["initial_prompt"] = previous.text.strip()
+
+        warnings.filterwarnings("ignore")
+        segments, _ = self.refine_model.transcribe(
+            audio[int(start * SAMPLE_RATE):int(end * SAMPLE_RATE)], **transcribe_args)
+        segments = [shift_segment(segment, start) for segment in segments]
+        warnings.filterwarnings("default")
+
+        return [dataclasses.replace(segment, end=min(segment.end, end)) for segment in segments
+                if segment.start < end]
+
+    def get_chunk_pool(self) -> ProcessPoolExecutor:
+        with self.chunk_pool_lock:
+            if self.chunk_pool is None:
+                model_args = dict(self.model_args)
+                if model_args.get("cpu_threads", 0) == 0:
+                    model_args["cpu_threads"] = max(1, (os.cpu_count() or 1) // self.parallel_chunks)
+
+                # Forking a process with a loaded CTranslate2 model is unsafe, start clean workers
+                self.chunk_pool = ProcessPoolExecutor(
+                    max_workers=self.parallel_chunks,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=init_chunk_worker, initargs=(model_args, self.batch_size))
+            return self.chunk_pool
+
+    def close(self) -> None:
+        if self.chunk_pool is not None:
+            self.chunk_pool.shutdown()
+            self.chunk_pool = None
+
+    @staticmethod
+    def chunks_iterator(chunks: list[Future], duration: float) -> Iterable[Segment]:
+        segment_id = 0
+        with tqdm(total=round(duration, 2), unit=" seconds") as pbar:
+            for chunk in chunks:
+                for segment in chunk.result():
+                    segment_id += 1
+                    yield dataclasses.replace(segment, id=segment_id)
+                    pbar.update(segment.end - segment.start)
+            pbar.update(0)
 
     @staticmethod
     def subtitles_iterator(segments: Iterable[Segment],
@@ -76,3 +431,69 @@ class WhisperAI:
                 yield segment
                 pbar.update(segment.end - segment.start)
             pbar.update(0)
+
+
+def make_inference(model: WhisperModel, batch_size: int) -> tuple:
+    """
+    Returns the object to call transcribe on and the extra arguments it needs.
+    """
+    if batch_size > 0:
+        # Without timestamps the pipeline emits one segment per VAD chunk of up to 30 seconds
+        return BatchedInferencePipeline(model=model), {"batch_size": batch_size,
+                                                       "without_timestamps": False}
+    return model, {}
+
+
+_chunk_inference: Optional[tuple] = None
+
+
+def init_chunk_worker(model_args: dict, batch_size: int = 0) -> None:
+    global _chunk_inference  # pylint: disable=global-statement
+    _chunk_inference = make_inference(WhisperModel(**model_args), batch_size)
+
+
+def transcribe_chunk(audio: np.ndarray, offset: float, transcribe_args: dict) -> list[Segment]:
+    warnings.filterwarnings("ignore")
+    inference, inference_args = _chunk_inference
+    segments, _ = inference.transcribe(audio, **transcribe_args, **inference_args)
+    return [shift_segment(segment, offset) for segment in segments]
+
+
+def shift_segment(segment: Segment, offset: float) -> Segment:
+    words = segment.words
+    if words is not None:
+        words = [dataclasses.replace(word, start=max(word.start + offset, 0.0),
+                                     end=max(word.end + offset, 0.0))
+                 for word in words]
+
+    return dataclasses.replace(segment, start=max(segment.start + offset, 0.0),
+                               end=max(segment.end + offset, 0.0), words=words)
+
+
+def find_split_points(audio: np.ndarray, chunk_count: int) -> list[int]:
+    """
+    Finds sample offsets to cut the audio into `chunk_count` pieces of similar length.
+
+    Each cut is placed at the quietest frame (by RMS energy) around the even split point,
+    so that words are not cut in half. Returns [0, len(audio)] if the audio is too short.
+    """
+    chunk_count = min(chunk_count, len(audio) // (MIN_CHUNK_DURATION * SAMPLE_RATE))
+    if chunk_count < 2:
+        return [0, len(audio)]
+
+    frame_size = int(SPLIT_FRAME_DURATION * SAMPLE_RATE)
+    frame_count = len(audio) // frame_size
+    frames = audio[:frame_count * frame_size].reshape(frame_count, frame_size)
+    energy = np.einsum('ij,ij->i', frames, frames)
+
+    window = int(SPLIT_SEARCH_WINDOW / SPLIT_FRAME_DURATION)
+    split_points = [0]
+    for index in range(1, chunk_count):
+        target = index * frame_count // chunk_count
+        low = max(target - window, split_points[-1] // frame_size + 1)
+        high = min(target + window, frame_count)
+        cut = low + int(np.argmin(energy[low:high]))
+        split_points.append(cut * frame_size + frame_size // 2)
+
+    split_points.append(len(audio))
+    return split_points
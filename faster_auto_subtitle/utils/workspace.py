@@ -0,0 +1,74 @@
+import os
+import re
+import shutil
+import logging
+import tempfile
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+TMPFS_DIR = '/dev/shm'
+# Job directories end up in ffmpeg filter arguments, where quotes and colons need escaping
+UNSAFE_NAME_CHARS = re.compile(r'[^\w.-]')
+
+
+class Workspace:
+    """
+    Isolated directory for intermediate files of a single run.
+
+    Every file gets its own uniquely named job directory, which is removed as soon as the file
+    is processed, and the whole workspace is removed on exit. If `use_tmpfs` is set, job
+    directories are placed on tmpfs (`/dev/shm`) as long as at least `tmpfs_min_free` bytes
+    stay free there after the expected job size, otherwise they fall back to disk.
+    """
+
+    def __init__(self, base_dir: Optional[str] = None, use_tmpfs: bool = False,
+                 tmpfs_min_free: int = 0):
+        self.base_dir = base_dir or tempfile.gettempdir()
+        self.use_tmpfs = use_tmpfs and os.path.isdir(TMPFS_DIR)
+        self.tmpfs_min_free = tmpfs_min_free
+        self.disk_root: Optional[str] = None
+        self.tmpfs_root: Optional[str] = None
+
+    def __enter__(self):
+        if self.use_tmpfs:
+            self.tmpfs_root = tempfile.mkdtemp(prefix='faster_auto_subtitle_', dir=TMPFS_DIR)
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
+        for root in (self.tmpfs_root, self.disk_root):
+            if root is not None:
+                shutil.rmtree(root, ignore_errors=True)
+        self.tmpfs_root = None
+        self.disk_root = None
+
+    def make_disk_root(self) -> str:
+        os.makedirs(self.base_dir, exist_ok=True)
+        return tempfile.mkdtemp(prefix='faster_auto_subtitle_', dir=self.base_dir)
+
+    def fits_tmpfs(self, expected_size: int) -> bool:
+        if self.tmpfs_root is None:
+            return False
+        return shutil.disk_usage(self.tmpfs_root).free - expected_size >= self.tmpfs_min_free
+
+    def make_dir(self, name: str, expected_size: int = 0) -> str:
+        if self.fits_tmpfs(expected_size):
+            root = self.tmpfs_root
+        else:
+            if self.tmpfs_root is not None:
+                logger.info("Not enough space on %s, using %s for %s.",
+                            TMPFS_DIR, self.base_dir, name)
+            if self.disk_root is None:
+                self.disk_root = self.make_disk_root()
+            root = self.disk_root
+
+        return tempfile.mkdtemp(prefix=f"{UNSAFE_NAME_CHARS.sub('_', name)}_", dir=root)
+
+    @contextmanager
+    def job_dir(self, name: str, expected_size: int = 0) -> Iterator[str]:
+        path = self.make_dir(name, expected_size)
+        try:
+            yield path
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
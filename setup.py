@@ -22,7 +22,8 @@ setup(
     ],
     description="Automatically generate and embed subtitles into your videos",
     entry_points={
-        'console_scripts': ['faster_auto_subtitle=faster_auto_subtitle.cli:main'],
+        'console_scripts': ['faster_auto_subtitle=faster_auto_subtitle.cli:main',
+                            'faster_auto_subtitle_server=faster_auto_subtitle.server:main'],
     },
     include_package_data=True,
 )